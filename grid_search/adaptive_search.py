@@ -0,0 +1,185 @@
+import argparse
+import math
+from typing import Callable, List, NamedTuple, Tuple
+
+from executor import GridSearchExecutor, griewank
+from interval import Interval
+from reduction import Point, TopKReduction
+from work import Work
+
+
+class AdaptiveSearchResult(NamedTuple):
+    best: List[Tuple[float, Point]]
+    evaluations: int
+    rounds: int
+
+
+class _Cell(NamedTuple):
+    work: Work
+    probes: Work
+    strides: List[int]
+    centers: List[int]
+
+
+def _probe_interval(interval: Interval, branching: int) -> Tuple[Interval, int, int]:
+    # The interval is split in blocks of stride elements and each block is probed once, close to
+    # its center. Probes are kept on a lattice so the whole cell is probed as a single Work.
+    stride = max(1, math.ceil(interval.size / branching))
+    amount_of_blocks = math.ceil(interval.size / stride)
+    center = min(stride // 2, interval.size - 1 - (amount_of_blocks - 1) * stride)
+    probe_origin = interval.origin + (interval.offset + center) * interval.step
+    return Interval.from_lattice(probe_origin, interval.step * stride, 0, amount_of_blocks), stride, center
+
+
+class AdaptiveGridSearch:
+    # Coarse to fine search: every cell is probed on a coarse lattice, the best probes across all
+    # cells are kept and the block of the cell around each of them becomes a cell of the next
+    # round. It stops once the cells are probed at full resolution or the budget runs out.
+    def __init__(self, objective: Callable[[Point], float],
+                 keep: int = 4,
+                 branching: int = 8,
+                 max_evaluations: int = None,
+                 largest: bool = False,
+                 workers: int = None,
+                 max_chunk_size: int = 4096):
+        self._objective = objective
+        self._reduction = TopKReduction(keep, largest=largest)
+        # Probes of every round are evaluated in parallel by the same executor and process pool
+        self._executor = GridSearchExecutor(objective, self._reduction, workers=workers,
+                                            max_chunk_size=max_chunk_size)
+        self._branching = branching
+        self._max_evaluations = max_evaluations
+
+    def __cell(self, work: Work, branching: int = None) -> _Cell:
+        probe_intervals, strides, centers = [], [], []
+        for interval in work.intervals:
+            probe_interval, stride, center = _probe_interval(interval, branching or self._branching)
+            probe_intervals.append(probe_interval)
+            strides.append(stride)
+            centers.append(center)
+        return _Cell(work, Work(probe_intervals), strides, centers)
+
+    @staticmethod
+    def __indices(cell: _Cell, point: Point) -> List[int]:
+        # Index of the point on each interval of the cell. Cells are sub-works of the same lattice,
+        # so rounding to it is exact, while rounding to the coarser probe lattice of a cell would
+        # also match points of the neighbouring cells.
+        return [round((value - interval.origin) / interval.step) - interval.offset
+                for value, interval in zip(point, cell.work.intervals)]
+
+    def __blocks(self, cell: _Cell, point: Point) -> List[int]:
+        return [index // stride for index, stride in zip(self.__indices(cell, point), cell.strides)]
+
+    def __contains(self, cell: _Cell, point: Point) -> bool:
+        # The cells of a round are disjoint, a probe is contained in the cell it comes from only
+        return all(0 <= index < interval.size
+                   for index, interval in zip(self.__indices(cell, point), cell.work.intervals))
+
+    def __lattice_point(self, cell: _Cell, point: Point) -> Point:
+        # Probe values are recomputed from the cell lattice so the reported points are exact
+        return [interval.value(block * stride + center)
+                for block, interval, stride, center in zip(self.__blocks(cell, point), cell.work.intervals,
+                                                           cell.strides, cell.centers)]
+
+    def __refine(self, cell: _Cell, point: Point) -> Work:
+        sub_intervals = []
+        for block, interval, stride in zip(self.__blocks(cell, point), cell.work.intervals, cell.strides):
+            sub_intervals.append(interval.sub_interval(block * stride, min((block + 1) * stride, interval.size)))
+        return Work(sub_intervals)
+
+    def __fit_to_budget(self, cells: List[_Cell], remaining: int) -> List[_Cell]:
+        # Cells are probed more coarsely when the budget can not afford the configured branching.
+        # Branching below 2 would not refine a cell, so the cells that can not afford it are dropped.
+        affordable_cells = []
+        for pos, cell in enumerate(cells):
+            budget_per_cell = remaining // (len(cells) - pos)
+            if cell.probes.size > budget_per_cell:
+                branching = int(budget_per_cell ** (1 / max(cell.work.dim, 1)))
+                if branching < 2:
+                    continue
+                cell = self.__cell(cell.work, branching)
+            affordable_cells.append(cell)
+            remaining -= cell.probes.size
+        return affordable_cells
+
+    def search(self, work: Work) -> AdaptiveSearchResult:
+        with self._executor:
+            return self.__search(work)
+
+    def __search(self, work: Work) -> AdaptiveSearchResult:
+        best = self._reduction.identity()
+        # Centers of refined cells are probed again, they are only counted once in the result
+        best_points = set()
+        cells = [self.__cell(work)]
+        evaluations = 0
+        rounds = 0
+
+        while cells:
+            if self._max_evaluations is not None:
+                cells = self.__fit_to_budget(cells, self._max_evaluations - evaluations)
+                if not cells:
+                    break
+
+            round_result = self._executor.run_all([cell.probes for cell in cells])
+            evaluations += round_result.points
+            rounds += 1
+
+            next_cells = []
+            for value, point in round_result.result:
+                cell = next(cell for cell in cells if self.__contains(cell, point))
+                lattice_point = self.__lattice_point(cell, point)
+                if tuple(lattice_point) not in best_points:
+                    best_points.add(tuple(lattice_point))
+                    if lattice_point != point:
+                        # The probe lattice may round the point differently, the value is of the reported point
+                        value = self._objective(lattice_point)
+                        evaluations += 1
+                    best = self._reduction.accumulate(best, value, lattice_point)
+                # Cells probed at full resolution have nothing left to refine
+                if any(stride > 1 for stride in cell.strides):
+                    next_cells.append(self.__cell(self.__refine(cell, point)))
+            cells = next_cells
+
+        return AdaptiveSearchResult(self._reduction.result(best), evaluations, rounds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-w", "--workers",
+                        default=None,
+                        help="Amount of worker processes. Default is the amount of CPUs",
+                        type=int)
+    parser.add_argument("-n", "--points_per_dim",
+                        default=10000,
+                        help="Amount of points on each interval of the searched work. Default is 10000",
+                        type=int)
+    parser.add_argument("-d", "--dim",
+                        default=3,
+                        help="Amount of intervals of the searched work. Default is 3",
+                        type=int)
+    parser.add_argument("-k", "--keep",
+                        default=4,
+                        help="Amount of cells refined on each round. Default is 4",
+                        type=int)
+    parser.add_argument("-b", "--branching",
+                        default=8,
+                        help="Amount of blocks each interval of a cell is probed in. Default is 8",
+                        type=int)
+    parser.add_argument("-e", "--max_evaluations",
+                        default=None,
+                        help="Maximum amount of objective evaluations. Default is no limit",
+                        type=int)
+
+    args = parser.parse_args()
+    work = Work([Interval(-600, 600, 1200 / args.points_per_dim) for _ in range(args.dim)])
+    search = AdaptiveGridSearch(griewank, keep=args.keep, branching=args.branching,
+                                max_evaluations=args.max_evaluations, workers=args.workers)
+    search_result = search.search(work)
+
+    print(f"Best: {search_result.best}")
+    print(f"{search_result.evaluations} evaluations in {search_result.rounds} rounds, "
+          f"{work.size / max(search_result.evaluations, 1):,.0f}x fewer than the full sweep of {work.size} points")
+
+
+if __name__ == "__main__":
+    main()
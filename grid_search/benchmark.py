@@ -0,0 +1,285 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from interval import Interval
+from wire_format import decode_works, encode_works
+from work import Work
+
+
+def count_points(points: Iterator) -> int:
+    return sum(1 for _ in points)
+
+
+def count_batched_points(batches: Iterator) -> int:
+    return sum(len(batch) for batch in batches)
+
+
+def multiset_hash(points: Iterator) -> Tuple[int, int]:
+    # Order independent fingerprint of a multiset of points, it takes constant memory
+    total = 0
+    amount = 0
+    for point in points:
+        total = (total + hash(tuple(point))) & 0xFFFFFFFFFFFFFFFF
+        amount += 1
+    return total, amount
+
+
+def check_split(work: Work, max_chunk_size: int) -> List[int]:
+    plan = work.plan(max_chunk_size)
+    chunk_sizes = []
+    chunks_hash = 0
+    expected_start = 0
+    for chunk_index in range(plan.amount_of_chunks):
+        chunk = plan[chunk_index]
+        start, stop = plan.index_range(chunk_index)
+        chunk_hash, chunk_points = multiset_hash(chunk.unfold())
+        if start != expected_start or chunk_points != stop - start or chunk_points != chunk.size:
+            raise AssertionError(f"Chunk {chunk_index} of {work} has {chunk_points} points for range {start, stop}")
+        if plan.chunk_at(start) != chunk_index or plan.chunk_at(stop - 1) != chunk_index:
+            raise AssertionError(f"Points {start} and {stop - 1} of {work} are not found in chunk {chunk_index}")
+        if chunk_points > max_chunk_size:
+            raise AssertionError(f"Chunk {chunk_index} of {work} has {chunk_points} points, max is {max_chunk_size}")
+        chunks_hash = (chunks_hash + chunk_hash) & 0xFFFFFFFFFFFFFFFF
+        chunk_sizes.append(chunk_points)
+        expected_start = stop
+
+    work_hash, work_points = multiset_hash(work.unfold())
+    if work_points != sum(chunk_sizes) or work_hash != chunks_hash:
+        raise AssertionError(f"Chunks of {work} hold {sum(chunk_sizes)} points that differ from its {work_points}")
+    return chunk_sizes
+
+
+def random_work(rng: random.Random, max_dim: int, max_points_per_dim: int) -> Work:
+    intervals = []
+    for _ in range(rng.randint(1, max_dim)):
+        step = rng.choice([1, 2, 3, 0.1, 0.25, 1.2, 4.3, rng.uniform(0.001, 10)])
+        start = rng.choice([0, -10, 3, rng.uniform(-100, 100)])
+        points = rng.randint(1, max_points_per_dim)
+        intervals.append(Interval(start, start + points * step, step))
+    return Work(intervals)
+
+
+def balance(chunk_sizes: List[int]) -> Dict[str, float]:
+    mean = statistics.mean(chunk_sizes)
+    return {
+        "chunks": len(chunk_sizes),
+        "max": max(chunk_sizes),
+        "min": min(chunk_sizes),
+        "cv": statistics.pstdev(chunk_sizes) / mean if mean else 0.0,
+    }
+
+
+def peak_memory(run: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_throughput(name: str, run: Callable[[], int], repetitions: int, unit: str = "points") -> float:
+    best_elapsed = None
+    amount = 0
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        amount = run()
+        elapsed = time.perf_counter() - start_time
+        best_elapsed = elapsed if best_elapsed is None else min(best_elapsed, elapsed)
+
+    throughput = amount / best_elapsed
+    print(f"{name:<60} {amount:>12} {unit} {best_elapsed:>10.4f} s {throughput:>16,.0f} {unit}/s")
+    return throughput
+
+
+def benchmark_unfold(works: List[Work], batch_size: int, precision: int | None, repetitions: int):
+    for work in works:
+        print(f"Work {work} ({work.size} points, dim {work.dim})")
+        generator_speed = measure_throughput("unfold",
+                                             lambda: count_points(work.unfold(precision)),
+                                             repetitions)
+        batched_speed = measure_throughput(f"unfold_batches({batch_size})",
+                                           lambda: count_batched_points(work.unfold_batches(batch_size, precision)),
+                                           repetitions)
+        print(f"Speedup: {batched_speed / generator_speed:.1f}x\n")
+
+
+def benchmark_wire_format(works: List[Work], max_chunk_size: int, repetitions: int):
+    for work in works:
+        sub_works = list(work.split(max_chunk_size))
+        print(f"Work {work} split in {len(sub_works)} sub works of up to {max_chunk_size} points")
+        repr_bytes = sum(len(repr(sub_work).encode()) for sub_work in sub_works)
+        binary_bytes = len(encode_works(sub_works))
+        print(f"repr: {repr_bytes} bytes, binary batch: {binary_bytes} bytes")
+        measure_throughput("encode_works",
+                           lambda: encode_works(sub_works) and len(sub_works),
+                           repetitions, unit="works")
+        encoded = encode_works(sub_works)
+        measure_throughput("decode_works",
+                           lambda: len(decode_works(encoded)),
+                           repetitions, unit="works")
+        print()
+
+
+def default_works(points_per_dim: int) -> List[Work]:
+    return [
+        Work([Interval(0, points_per_dim ** 2, 1)]),
+        Work([Interval(-1, 1, 2 / points_per_dim),
+              Interval(0, 10, 10 / points_per_dim)]),
+        Work([Interval(0, 1, 1 / points_per_dim),
+              Interval(-5, 5, 10 / points_per_dim),
+              Interval(3, 3.3, 0.3 / points_per_dim)]),
+    ]
+
+
+def suite_work(dim: int, size: int) -> Work:
+    points_per_dim = max(1, round(size ** (1 / dim)))
+    return Work([Interval(-1, 1, 2 / points_per_dim) for _ in range(dim)])
+
+
+def run_suite(dims: List[int], sizes: List[int], max_chunk_sizes: List[int], repetitions: int) -> List[Dict]:
+    cases = []
+
+    def add_case(name: str, work: Work, run: Callable[[], int], unit: str, **extra):
+        label = f"{name} dim={work.dim} size={work.size}"
+        if "max_chunk_size" in extra:
+            label += f" max_chunk_size={extra['max_chunk_size']}"
+        throughput = measure_throughput(label, run, repetitions, unit)
+        cases.append({
+            "name": name,
+            "dim": work.dim,
+            "size": work.size,
+            "throughput": throughput,
+            "unit": f"{unit}/s",
+            "peak_memory_bytes": peak_memory(run),
+            **extra,
+        })
+
+    for dim in dims:
+        for size in sizes:
+            work = suite_work(dim, size)
+            interval = work.intervals[0]
+            add_case("interval_split", work, lambda: sum(1 for _ in interval.split(interval.size)), "intervals")
+            add_case("work_unfold", work, lambda: count_points(work.unfold()), "points")
+
+            for max_chunk_size in max_chunk_sizes:
+                plan = work.plan(max_chunk_size)
+                chunk_indices = random.Random(0).choices(range(plan.amount_of_chunks),
+                                                         k=min(10000, plan.amount_of_chunks))
+                add_case("work_split", work, lambda: sum(1 for _ in work.split(max_chunk_size)), "chunks",
+                         max_chunk_size=max_chunk_size, balance=balance(check_split(work, max_chunk_size)))
+                add_case("work_plan_random_access", work, lambda: sum(1 for k in chunk_indices if plan[k]), "chunks",
+                         max_chunk_size=max_chunk_size)
+    return cases
+
+
+def case_key(case: Dict) -> Tuple:
+    return case["name"], case["dim"], case["size"], case.get("max_chunk_size")
+
+
+def find_regressions(cases: List[Dict], baseline_cases: List[Dict], tolerance: float) -> List[str]:
+    baseline = {case_key(case): case for case in baseline_cases}
+    regressions = []
+    for case in cases:
+        previous = baseline.get(case_key(case))
+        if previous is None:
+            continue
+        if case["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{case_key(case)}: throughput {case['throughput']:,.0f} {case['unit']} "
+                               f"< baseline {previous['throughput']:,.0f}")
+        if case["peak_memory_bytes"] > previous["peak_memory_bytes"] * (1 + tolerance) + 4096:
+            regressions.append(f"{case_key(case)}: peak memory {case['peak_memory_bytes']} B "
+                               f"> baseline {previous['peak_memory_bytes']} B")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    suite_parser = subparsers.add_parser("suite", help="Split and unfold suite with machine readable results")
+    suite_parser.add_argument("--dims",
+                              default=[1, 2, 3, 4],
+                              nargs="+",
+                              help="Amounts of intervals of the benchmarked works. Default is 1 2 3 4",
+                              type=int)
+    suite_parser.add_argument("--sizes",
+                              default=[10 ** 4, 10 ** 5],
+                              nargs="+",
+                              help="Approximate amounts of points of the benchmarked works. Default is 10000 100000",
+                              type=int)
+    suite_parser.add_argument("--max_chunk_sizes",
+                              default=[7, 1000],
+                              nargs="+",
+                              help="Maximum chunk sizes used to split the works. Default is 7 1000",
+                              type=int)
+    suite_parser.add_argument("-o", "--output",
+                              default="benchmark_results.json",
+                              help="Path where the JSON results are written. Default is benchmark_results.json",
+                              type=str)
+    suite_parser.add_argument("--baseline",
+                              default=None,
+                              help="JSON results of a previous run, the run fails if it regressed. Default is none",
+                              type=str)
+    suite_parser.add_argument("--tolerance",
+                              default=0.2,
+                              help="Allowed relative regression against the baseline. Default is 0.2",
+                              type=float)
+
+    unfold_parser = subparsers.add_parser("unfold", help="Compares unfold against unfold_batches")
+    unfold_parser.add_argument("-b", "--batch_size",
+                               default=65536,
+                               help="Amount of points per batch of unfold_batches. Default is 65536",
+                               type=int)
+    unfold_parser.add_argument("-p", "--precision",
+                               default=None,
+                               help="Precision used to round the unfolded values. Default is no rounding",
+                               type=int)
+
+    wire_parser = subparsers.add_parser("wire", help="Compares the binary wire format against repr")
+    wire_parser.add_argument("-c", "--max_chunk_size",
+                             default=16,
+                             help="Maximum amount of points per sub work. Default is 16",
+                             type=int)
+
+    for subparser in (suite_parser, unfold_parser, wire_parser):
+        subparser.add_argument("-r", "--repetitions",
+                               default=3,
+                               help="Repetitions of each measurement, the fastest one is reported. Default is 3",
+                               type=int)
+    for subparser in (unfold_parser, wire_parser):
+        subparser.add_argument("-n", "--points_per_dim",
+                               default=100,
+                               help="Amount of points on each interval of the benchmarked works. Default is 100",
+                               type=int)
+
+    args = parser.parse_args()
+    if args.benchmark == "unfold":
+        benchmark_unfold(default_works(args.points_per_dim), args.batch_size, args.precision, args.repetitions)
+        return
+    if args.benchmark == "wire":
+        benchmark_wire_format(default_works(args.points_per_dim), args.max_chunk_size, args.repetitions)
+        return
+
+    cases = run_suite(args.dims, args.sizes, args.max_chunk_sizes, args.repetitions)
+    with open(args.output, "w") as f:
+        json.dump({"python": platform.python_version(), "platform": platform.platform(), "cases": cases}, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = find_regressions(cases, json.load(f)["cases"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from typing import List, Iterator, TypeVar, Generic
+from typing import List, Iterator, Tuple, TypeVar, Generic
 
 from circular_iterator import CircularIterator
 
@@ -54,3 +54,64 @@ class CartesianProductCalculator(Generic[T]):
                 positions[i] = 0
                 if i == 0:
                     return
+
+    @staticmethod
+    def calculate_with_changes(lists_of_values: List[List[T]]) -> Iterator[Tuple[List[T], int]]:
+        # Yields each product together with the position of the outermost value that changed since
+        # the previous one (0 for the first), so every value from that position on has to be
+        # recomputed. The yielded list is reused between iterations.
+        positions = [0 for _ in lists_of_values]
+        max_positions = [len(values) for values in lists_of_values]
+
+        for value in lists_of_values:
+            if not value:
+                return
+
+        current_values = [values[0] for values in lists_of_values]
+        changed_position = 0
+
+        while True:
+            yield current_values, changed_position
+
+            for i in range(len(lists_of_values) - 1, -1, -1):
+                positions[i] += 1
+                if positions[i] < max_positions[i]:
+                    break
+                positions[i] = 0
+                if i == 0:
+                    return
+
+            changed_position = i
+            for j in range(i, len(lists_of_values)):
+                current_values[j] = lists_of_values[j][positions[j]]
+
+    @staticmethod
+    def calculate_gray(lists_of_values: List[List[T]]) -> Iterator[Tuple[List[T], int]]:
+        # Reflected mixed-radix Gray code order: after the first product exactly one value changes
+        # per step, and its position is yielded along with the values. The yielded list is reused
+        # between iterations.
+        positions = [0 for _ in lists_of_values]
+        directions = [1 for _ in lists_of_values]
+        max_positions = [len(values) for values in lists_of_values]
+
+        for value in lists_of_values:
+            if not value:
+                return
+
+        current_values = [values[0] for values in lists_of_values]
+        yield current_values, 0
+
+        while True:
+            i = len(lists_of_values) - 1
+            while i >= 0:
+                next_position = positions[i] + directions[i]
+                if 0 <= next_position < max_positions[i]:
+                    break
+                directions[i] = -directions[i]
+                i -= 1
+            if i < 0:
+                return
+
+            positions[i] = next_position
+            current_values[i] = lists_of_values[i][next_position]
+            yield current_values, i
@@ -0,0 +1,131 @@
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Callable, Dict, List, Tuple
+
+from work import Work, WorkPlan
+
+
+class CostModel(ABC):
+    # Estimated cost of ranges of chunks of a plan, used to group chunks into tasks of similar
+    # cost instead of a similar amount of points. A model that needs every chunk of the plan
+    # sets materializes_plan, it can not be used where the plan is streamed.
+    materializes_plan = False
+
+    @abstractmethod
+    def range_cost(self, plan: WorkPlan, first_chunk: int, last_chunk: int) -> float:
+        pass
+
+    def advance(self, plan: WorkPlan, first_chunk: int, last_chunk: int, budget: float) -> int:
+        # End of the shortest range starting at first_chunk whose cost reaches the budget, at least
+        # one chunk and at most up to last_chunk
+        end = first_chunk + 1
+        while end < last_chunk and self.range_cost(plan, first_chunk, end) < budget:
+            end += 1
+        return end
+
+    def observe(self, plan: WorkPlan, first_chunk: int, last_chunk: int, elapsed: float):
+        pass
+
+
+class CallableCostModel(CostModel):
+    # Cost given by a function of each chunk, e.g. an estimate from the region it covers. The
+    # schedule needs the cost of all the chunks left, so on the first lookup of a plan every
+    # chunk is built and costed once and the prefix sums of the costs are kept: O(chunks) time
+    # and memory. Use it with the executor, the manager streams the plan and rejects it.
+    materializes_plan = True
+
+    def __init__(self, chunk_cost: Callable[[Work], float]):
+        self._chunk_cost = chunk_cost
+        self._plan: WorkPlan | None = None
+        self._prefix_costs: List[float] = []
+
+    def __prefix_costs(self, plan: WorkPlan) -> List[float]:
+        # Only the costs of the last plan are kept, a run schedules the chunks of a single plan
+        if plan is not self._plan:
+            self._prefix_costs = list(accumulate((self._chunk_cost(chunk) for chunk in plan), initial=0.0))
+            self._plan = plan
+        return self._prefix_costs
+
+    def range_cost(self, plan: WorkPlan, first_chunk: int, last_chunk: int) -> float:
+        prefix_costs = self.__prefix_costs(plan)
+        return prefix_costs[last_chunk] - prefix_costs[first_chunk]
+
+    def advance(self, plan: WorkPlan, first_chunk: int, last_chunk: int, budget: float) -> int:
+        prefix_costs = self.__prefix_costs(plan)
+        end = bisect_left(prefix_costs, prefix_costs[first_chunk] + budget, first_chunk + 1, last_chunk)
+        return max(first_chunk + 1, min(end, last_chunk))
+
+
+class LearnedCostModel(CostModel):
+    # Cost per point learned from the timings of finished tasks. The points of a work are split
+    # in regions of consecutive flat indices, which are slabs of its leading intervals, and the
+    # time of a task is spread over the regions it covers in proportion to its points. Regions
+    # not timed yet cost the average of the timed ones, so before any timing the cost of a range
+    # is its amount of points and tasks are the same as when balancing by points.
+    def __init__(self, regions: int = 256):
+        self._regions = regions
+        self._timings: Dict[str, Tuple[List[float], List[float]]] = {}
+        self._last_work: Work | None = None
+        self._last_timings: Tuple[List[float], List[float]] = ([], [])
+
+    def __timings(self, work: Work) -> Tuple[List[float], List[float]]:
+        # Timings are kept by the intervals of the work, so equal works of later runs share them.
+        # Lookups of a run are for the same work object, its key is only built once.
+        if work is not self._last_work:
+            key = repr(work)
+            if key not in self._timings:
+                self._timings[key] = ([0.0] * self._regions, [0.0] * self._regions)
+            self._last_work, self._last_timings = work, self._timings[key]
+        return self._last_timings
+
+    def __region_bounds(self, work: Work, region: int) -> Tuple[int, int]:
+        return region * work.size // self._regions, (region + 1) * work.size // self._regions
+
+    def __region_at(self, work: Work, index: int) -> int:
+        return ((index + 1) * self._regions - 1) // work.size
+
+    @staticmethod
+    def __point_range(plan: WorkPlan, first_chunk: int, last_chunk: int) -> Tuple[int, int]:
+        return plan.index_range(first_chunk)[0], plan.index_range(last_chunk - 1)[1]
+
+    def __overlaps(self, work: Work, start: int, stop: int):
+        for region in range(self.__region_at(work, start), self.__region_at(work, stop - 1) + 1):
+            region_start, region_stop = self.__region_bounds(work, region)
+            yield region, max(start, region_start), min(stop, region_stop)
+
+    def cost_per_point(self, work: Work) -> List[float]:
+        seconds, points = self.__timings(work)
+        timed_points = sum(points)
+        default = sum(seconds) / timed_points if timed_points > 0 else 1.0
+        return [region_seconds / region_points if region_points > 0 else default
+                for region_seconds, region_points in zip(seconds, points)]
+
+    def range_cost(self, plan: WorkPlan, first_chunk: int, last_chunk: int) -> float:
+        if first_chunk >= last_chunk:
+            return 0.0
+        cost_per_point = self.cost_per_point(plan.work)
+        start, stop = self.__point_range(plan, first_chunk, last_chunk)
+        return sum((overlap_stop - overlap_start) * cost_per_point[region]
+                   for region, overlap_start, overlap_stop in self.__overlaps(plan.work, start, stop))
+
+    def advance(self, plan: WorkPlan, first_chunk: int, last_chunk: int, budget: float) -> int:
+        cost_per_point = self.cost_per_point(plan.work)
+        start, stop = self.__point_range(plan, first_chunk, last_chunk)
+        end_point = stop
+        for region, overlap_start, overlap_stop in self.__overlaps(plan.work, start, stop):
+            region_cost = (overlap_stop - overlap_start) * cost_per_point[region]
+            if region_cost >= budget:
+                points = math.ceil(budget / cost_per_point[region]) if cost_per_point[region] > 0 else 1
+                end_point = min(overlap_start + max(points, 1), overlap_stop)
+                break
+            budget -= region_cost
+        return max(first_chunk + 1, min(plan.chunk_at(end_point - 1) + 1, last_chunk))
+
+    def observe(self, plan: WorkPlan, first_chunk: int, last_chunk: int, elapsed: float):
+        seconds, points = self.__timings(plan.work)
+        start, stop = self.__point_range(plan, first_chunk, last_chunk)
+        for region, overlap_start, overlap_stop in self.__overlaps(plan.work, start, stop):
+            seconds[region] += elapsed * (overlap_stop - overlap_start) / (stop - start)
+            points[region] += overlap_stop - overlap_start
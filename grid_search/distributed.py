@@ -0,0 +1,439 @@
+import argparse
+import multiprocessing
+import os
+import pickle
+import selectors
+import socket
+import stat
+import struct
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Callable, Deque, Dict, List, Tuple
+
+from cost_model import CostModel, LearnedCostModel
+from executor import ChunkResult, CostWeightedSchedule, GridSearchResult, GuidedSchedule, WorkerStats, \
+    add_worker_stats, griewank, print_report
+from interval import Interval
+from metrics import GridSearchMetrics, MetricsServer
+from reduction import Reduction, Point, MinReduction
+from wire_format import encode_works, iter_decode_works
+from work import Work
+
+# An address is either a (host, port) pair for TCP or a filesystem path for a Unix socket
+Address = Tuple[str, int] | str
+
+FRAME_HEADER = struct.Struct("!I")
+# Tasks are sent as a binary batch of works, every other message is pickled. Unpickling runs
+# code chosen by the sender, so the manager and the workers must only be reachable by trusted
+# hosts: bind to loopback, a Unix socket or a private cluster network.
+TASK_HEADER = struct.Struct("!cQ")
+PICKLED_KIND = b"P"
+TASK_KIND = b"T"
+
+SETUP = "setup"
+TASK = "task"
+STOP = "stop"
+HELLO = "hello"
+RESULT = "result"
+
+
+def is_socket(path: str) -> bool:
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+def create_listener(address: Address, backlog: int) -> socket.socket:
+    if isinstance(address, str):
+        # A socket left by a previous run is replaced, any other file is not ours to delete
+        if is_socket(address):
+            os.unlink(address)
+        elif os.path.lexists(address):
+            raise FileExistsError(f"{address} exists and is not a socket")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(address)
+    listener.listen(backlog)
+    return listener
+
+
+def connect(address: Address, timeout: float = 10.0) -> socket.socket:
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    deadline = time.monotonic() + timeout
+    while True:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+            break
+        except (ConnectionRefusedError, FileNotFoundError):
+            sock.close()
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def send_frame(sock: socket.socket, *payloads: bytes | bytearray):
+    size = sum(len(payload) for payload in payloads)
+    buffers = [memoryview(FRAME_HEADER.pack(size)), *(memoryview(payload) for payload in payloads)]
+    # sendmsg avoids joining the payloads but may send them partially
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if sent:
+            buffers[0] = buffers[0][sent:]
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytearray | None:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        amount = sock.recv_into(view[received:])
+        if amount == 0:
+            return None
+        received += amount
+    return buffer
+
+
+def recv_frame(sock: socket.socket) -> bytearray | None:
+    header = recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    return recv_exactly(sock, size)
+
+
+def send_message(sock: socket.socket, *message):
+    send_frame(sock, PICKLED_KIND, pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def send_task(sock: socket.socket, task_id: int, chunks: List[Work]):
+    send_frame(sock, TASK_HEADER.pack(TASK_KIND, task_id), encode_works(chunks))
+
+
+def recv_message(sock: socket.socket) -> tuple | None:
+    frame = recv_frame(sock)
+    if frame is None:
+        return None
+
+    view = memoryview(frame)
+    if view[:1] == TASK_KIND:
+        _, task_id = TASK_HEADER.unpack_from(view)
+        return TASK, task_id, iter_decode_works(view[TASK_HEADER.size:])
+    return pickle.loads(view[1:])
+
+
+def run_worker(address: Address):
+    sock = connect(address)
+    send_message(sock, HELLO, os.getpid())
+
+    objective = reduction = precision = None
+    try:
+        while True:
+            message = recv_message(sock)
+            if message is None or message[0] == STOP:
+                break
+            if message[0] == SETUP:
+                _, objective, reduction, precision = message
+                continue
+
+            _, task_id, chunks = message
+            started_at = time.time()
+            start_time = time.perf_counter()
+            partial = reduction.identity()
+            points = 0
+            for chunk in chunks:
+                partial = reduction.reduce_points(partial, objective, chunk.unfold(precision))
+                points += chunk.size
+            send_message(sock, RESULT, task_id, partial, points, time.perf_counter() - start_time, started_at)
+    except ConnectionError:
+        # The manager went away, its tasks are not ours to finish
+        pass
+    finally:
+        sock.close()
+
+
+class _WorkerConnection:
+    def __init__(self, sock: socket.socket, worker: int):
+        self.sock = sock
+        self.worker = worker
+        self.outstanding: Dict[int, Tuple[int, int]] = {}
+        self.sent_at: Dict[int, Tuple[float, float]] = {}
+        self.closed = False
+
+
+class GridSearchManager:
+    # Streams tasks of plan chunks to the connected workers. Each worker holds at most
+    # credits_per_worker tasks, and a new task is only built when a result returns a credit,
+    # so the manager never materialises more than workers * credits tasks of the plan.
+    def __init__(self, objective: Callable[[Point], float],
+                 reduction: Reduction,
+                 max_chunk_size: int = 4096,
+                 credits_per_worker: int = 2,
+                 guided_factor: int = 2,
+                 max_chunks_per_task: int = 64,
+                 precision: int = None,
+                 metrics: GridSearchMetrics = None,
+                 cost_model: CostModel = None,
+                 accept_timeout: float = 60.0,
+                 shutdown_timeout: float = 10.0):
+        if cost_model is not None and cost_model.materializes_plan:
+            raise ValueError(f"{type(cost_model).__name__} needs every chunk of the plan, the manager streams it")
+        self._objective = objective
+        self._reduction = reduction
+        self._max_chunk_size = max_chunk_size
+        self._credits_per_worker = credits_per_worker
+        self._guided_factor = guided_factor
+        self._max_chunks_per_task = max_chunks_per_task
+        self._precision = precision
+        self._metrics = metrics
+        self._cost_model = cost_model
+        self._accept_timeout = accept_timeout
+        self._shutdown_timeout = shutdown_timeout
+
+    def run(self, work: Work, address: Address, workers: int, spawn_local_workers: bool = True) -> GridSearchResult:
+        listener = create_listener(address, workers)
+        bound_address = listener.getsockname()
+        processes: List[multiprocessing.Process] = []
+        if spawn_local_workers:
+            for _ in range(workers):
+                process = multiprocessing.Process(target=run_worker, args=(bound_address,), daemon=True)
+                process.start()
+                processes.append(process)
+
+        connections: List[_WorkerConnection] = []
+        try:
+            self.__accept_workers(listener, workers, connections)
+            return self.__dispatch(work, connections)
+        finally:
+            # Whatever ended the run, workers still connected are stopped so they do not wait
+            # for tasks forever, and local workers that do not exit in time are terminated
+            for connection in connections:
+                self.__close(connection)
+            listener.close()
+            if isinstance(address, str) and is_socket(address):
+                os.unlink(address)
+            for process in processes:
+                process.join(self._shutdown_timeout)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+    def __accept_workers(self, listener: socket.socket, workers: int, connections: List[_WorkerConnection]):
+        listener.settimeout(self._accept_timeout)
+        while len(connections) < workers:
+            try:
+                sock, _ = listener.accept()
+            except TimeoutError:
+                raise TimeoutError(f"Only {len(connections)} of {workers} workers connected, none in the last "
+                                   f"{self._accept_timeout} s") from None
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(self._accept_timeout)
+            try:
+                hello = recv_message(sock)
+                if hello is not None:
+                    send_message(sock, SETUP, self._objective, self._reduction, self._precision)
+            except OSError:
+                hello = None
+            if hello is None:
+                # The worker went away before its setup, another one may still connect
+                sock.close()
+                continue
+            sock.settimeout(None)
+            connections.append(_WorkerConnection(sock, hello[1]))
+
+    @staticmethod
+    def __close(connection: _WorkerConnection):
+        if connection.closed:
+            return
+        try:
+            send_message(connection.sock, STOP)
+        except OSError:
+            pass
+        connection.sock.close()
+        connection.closed = True
+
+    def __dispatch(self, work: Work, connections: List[_WorkerConnection]) -> GridSearchResult:
+        plan = work.plan(self._max_chunk_size)
+        if self._cost_model is None:
+            tasks = iter(GuidedSchedule([(0, plan.amount_of_chunks)], len(connections), self._guided_factor,
+                                        self._max_chunks_per_task))
+        else:
+            tasks = iter(CostWeightedSchedule(plan, [(0, plan.amount_of_chunks)], self._cost_model, len(connections),
+                                              self._guided_factor, self._max_chunks_per_task))
+        # Tasks of workers that disconnected are handed out again before new ones
+        retried_tasks: Deque[Tuple[int, int]] = deque()
+        next_task_id = 0
+
+        partial = self._reduction.identity()
+        worker_stats: Dict[int, WorkerStats] = {}
+        points = 0
+        start_time = time.perf_counter()
+
+        def disconnect(connection: _WorkerConnection):
+            selector.unregister(connection.sock)
+            connection.sock.close()
+            connection.closed = True
+            retried_tasks.extend(connection.outstanding.values())
+            connection.outstanding.clear()
+            connection.sent_at.clear()
+            for other in connections:
+                fill_credits(other)
+
+        def send_next_task(connection: _WorkerConnection) -> bool:
+            nonlocal next_task_id
+            task = retried_tasks.popleft() if retried_tasks else next(tasks, None)
+            if task is None:
+                return False
+            first_chunk, last_chunk = task
+            split_start_time = time.perf_counter()
+            chunks = [plan[chunk_index] for chunk_index in range(first_chunk, last_chunk)]
+            split_time = time.perf_counter() - split_start_time
+            try:
+                send_task(connection.sock, next_task_id, chunks)
+            except OSError:
+                retried_tasks.appendleft(task)
+                disconnect(connection)
+                return False
+            connection.outstanding[next_task_id] = task
+            connection.sent_at[next_task_id] = (time.time(), split_time)
+            next_task_id += 1
+            return True
+
+        def fill_credits(connection: _WorkerConnection):
+            while not connection.closed and len(connection.outstanding) < self._credits_per_worker \
+                    and send_next_task(connection):
+                pass
+
+        with selectors.DefaultSelector() as selector:
+            for connection in connections:
+                selector.register(connection.sock, selectors.EVENT_READ, connection)
+            for connection in connections:
+                fill_credits(connection)
+
+            while any(connection.outstanding for connection in connections):
+                for key, _ in selector.select():
+                    connection: _WorkerConnection = key.data
+                    if connection.closed:
+                        # Disconnected while handling an earlier event of this batch
+                        continue
+                    try:
+                        message = recv_message(connection.sock)
+                    except OSError:
+                        # A worker that died with tasks left unread resets the connection
+                        message = None
+                    if message is None:
+                        disconnect(connection)
+                        continue
+
+                    _, task_id, task_partial, task_points, elapsed, started_at = message
+                    first_chunk, last_chunk = connection.outstanding.pop(task_id)
+                    sent_at, split_time = connection.sent_at.pop(task_id)
+                    chunk_result = ChunkResult(connection.worker, first_chunk, last_chunk, task_partial,
+                                               task_points, elapsed, split_time, started_at)
+                    if self._metrics is not None:
+                        # Queue wait relies on the clocks of the manager and worker nodes being in sync
+                        self._metrics.record_task(connection.worker, task_points, last_chunk - first_chunk, elapsed,
+                                                  split_time, started_at - sent_at)
+                    if self._cost_model is not None:
+                        self._cost_model.observe(plan, first_chunk, last_chunk, elapsed)
+                    partial = self._reduction.merge(partial, chunk_result.partial)
+                    points += chunk_result.points
+                    add_worker_stats(worker_stats, chunk_result)
+                    fill_credits(connection)
+
+        if retried_tasks or next(tasks, None) is not None:
+            raise ConnectionError("All workers disconnected before the work was finished")
+
+        return GridSearchResult(self._reduction.result(partial), points, time.perf_counter() - start_time,
+                                worker_stats)
+
+
+def parse_address(address: str) -> Address:
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("role",
+                        choices=["manager", "worker"],
+                        help="Whether to run the manager or a single worker")
+    parser.add_argument("-a", "--address",
+                        default="127.0.0.1:0",
+                        help="host:port for TCP or a path for a Unix socket. Messages are unpickled, anyone who "
+                             "can connect can run code on the manager and workers, so only bind to interfaces "
+                             "reachable by trusted hosts. Default is 127.0.0.1:0",
+                        type=str)
+    parser.add_argument("-w", "--workers",
+                        default=os.cpu_count(),
+                        help="Amount of workers the manager waits for. Default is the amount of CPUs",
+                        type=int)
+    parser.add_argument("--no_local_workers",
+                        action="store_true",
+                        help="Do not spawn local worker processes, wait for external ones instead")
+    parser.add_argument("-n", "--points_per_dim",
+                        default=100,
+                        help="Amount of points on each interval of the searched work. Default is 100",
+                        type=int)
+    parser.add_argument("-d", "--dim",
+                        default=3,
+                        help="Amount of intervals of the searched work. Default is 3",
+                        type=int)
+    parser.add_argument("-c", "--max_chunk_size",
+                        default=4096,
+                        help="Maximum amount of points per chunk. Default is 4096",
+                        type=int)
+    parser.add_argument("--credits",
+                        default=2,
+                        help="Maximum amount of tasks each worker holds at once. Default is 2",
+                        type=int)
+    parser.add_argument("--accept_timeout",
+                        default=60.0,
+                        help="Seconds the manager waits for each worker to connect. Default is 60",
+                        type=float)
+    parser.add_argument("--metrics_port",
+                        default=None,
+                        help="Port where the manager serves the metrics on /metrics. Default is not serving them",
+                        type=int)
+    parser.add_argument("--metrics_json",
+                        default=None,
+                        help="Path where the manager writes a JSON summary of the metrics. Default is none",
+                        type=str)
+    parser.add_argument("--learned_cost",
+                        action="store_true",
+                        help="Group chunks into tasks of similar cost, learned from the timings of finished tasks, "
+                             "instead of a similar amount of points")
+
+    args = parser.parse_args()
+    address = parse_address(args.address)
+
+    if args.role == "worker":
+        run_worker(address)
+        return
+
+    work = Work([Interval(-600, 600, 1200 / args.points_per_dim) for _ in range(args.dim)])
+    metrics = GridSearchMetrics()
+    manager = GridSearchManager(griewank, MinReduction(), max_chunk_size=args.max_chunk_size,
+                                credits_per_worker=args.credits, metrics=metrics, accept_timeout=args.accept_timeout,
+                                cost_model=LearnedCostModel() if args.learned_cost else None)
+    with MetricsServer(metrics, args.metrics_port) if args.metrics_port is not None else nullcontext():
+        print_report(manager.run(work, address, args.workers, spawn_local_workers=not args.no_local_workers))
+    if args.metrics_json is not None:
+        metrics.write_json_summary(args.metrics_json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+import argparse
+import math
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+from cost_model import CostModel, LearnedCostModel
+from interval import Interval
+from journal import ProgressJournal
+from metrics import GridSearchMetrics, MetricsServer
+from reduction import Reduction, Point, MinReduction
+from work import Work, WorkPlan
+
+
+class ChunkResult(NamedTuple):
+    worker: int
+    first_chunk: int
+    last_chunk: int
+    partial: object
+    points: int
+    elapsed: float
+    split_time: float = 0.0
+    started_at: float = 0.0
+
+
+class WorkerStats(NamedTuple):
+    points: int
+    tasks: int
+    busy_time: float
+
+    @property
+    def throughput(self) -> float:
+        return self.points / self.busy_time if self.busy_time > 0 else 0.0
+
+
+class GridSearchResult(NamedTuple):
+    result: object
+    points: int
+    elapsed: float
+    worker_stats: Dict[int, WorkerStats]
+
+    @property
+    def throughput(self) -> float:
+        return self.points / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def add_worker_stats(worker_stats: Dict[int, WorkerStats], chunk_result: ChunkResult):
+    stats = worker_stats.get(chunk_result.worker, WorkerStats(0, 0, 0.0))
+    worker_stats[chunk_result.worker] = WorkerStats(stats.points + chunk_result.points,
+                                                    stats.tasks + 1,
+                                                    stats.busy_time + chunk_result.elapsed)
+
+
+# State of each pool process, set once by the initializer so tasks only carry the work and chunk indices
+_worker_objective: Callable[[Point], float] | None = None
+_worker_reduction: Reduction | None = None
+_worker_precision: int | None = None
+
+
+def _init_worker(objective: Callable[[Point], float], reduction: Reduction, precision: int | None):
+    global _worker_objective, _worker_reduction, _worker_precision
+    _worker_objective = objective
+    _worker_reduction = reduction
+    _worker_precision = precision
+
+
+def evaluate_chunks(plan: WorkPlan, first_chunk: int, last_chunk: int, objective: Callable[[Point], float],
+                    reduction: Reduction, precision: int | None = None) -> ChunkResult:
+    started_at = time.time()
+    start_time = time.perf_counter()
+    partial = reduction.identity()
+    points = 0
+    split_time = 0.0
+    for chunk_index in range(first_chunk, last_chunk):
+        split_start_time = time.perf_counter()
+        chunk = plan[chunk_index]
+        split_time += time.perf_counter() - split_start_time
+        partial = reduction.reduce_points(partial, objective, chunk.unfold(precision))
+        points += chunk.size
+    return ChunkResult(os.getpid(), first_chunk, last_chunk, partial, points, time.perf_counter() - start_time,
+                       split_time, started_at)
+
+
+def _evaluate_chunks_in_worker(work: Work, max_chunk_size: int, first_chunk: int, last_chunk: int) -> ChunkResult:
+    return evaluate_chunks(work.plan(max_chunk_size), first_chunk, last_chunk, _worker_objective, _worker_reduction,
+                           _worker_precision)
+
+
+class GuidedSchedule:
+    # Guided self-scheduling over the chunks of a plan: each task takes a share of the chunks still
+    # unassigned, so early tasks are large and the tail is handed out one chunk at a time.
+    def __init__(self, chunk_ranges: List[Tuple[int, int]], workers: int, guided_factor: int = 2,
+                 max_chunks_per_task: int = None):
+        self._chunk_ranges = list(chunk_ranges)
+        self._workers = workers
+        self._guided_factor = guided_factor
+        self._max_chunks_per_task = max_chunks_per_task
+        self._remaining = sum(last - first for first, last in self._chunk_ranges)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        for first, last in self._chunk_ranges:
+            while first < last:
+                task_chunks = max(1, math.ceil(self._remaining / (self._guided_factor * self._workers)))
+                if self._max_chunks_per_task is not None:
+                    task_chunks = min(task_chunks, self._max_chunks_per_task)
+                task_chunks = min(task_chunks, last - first)
+                yield first, first + task_chunks
+                first += task_chunks
+                self._remaining -= task_chunks
+
+
+class CostWeightedSchedule:
+    # Guided self-scheduling over the estimated cost of the chunks instead of their amount: each
+    # task takes a share of the estimated cost still unassigned, so tasks in expensive regions
+    # hold fewer chunks. Costs are estimated again for every task, so a model that learns from
+    # finished tasks reshapes the tasks that are not built yet.
+    def __init__(self, plan: WorkPlan, chunk_ranges: List[Tuple[int, int]], cost_model: CostModel, workers: int,
+                 guided_factor: int = 2, max_chunks_per_task: int = None):
+        self._plan = plan
+        self._chunk_ranges = list(chunk_ranges)
+        self._cost_model = cost_model
+        self._workers = workers
+        self._guided_factor = guided_factor
+        self._max_chunks_per_task = max_chunks_per_task
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        for range_pos, (first, last) in enumerate(self._chunk_ranges):
+            while first < last:
+                remaining_ranges = [(first, last)] + self._chunk_ranges[range_pos + 1:]
+                remaining_cost = sum(self._cost_model.range_cost(self._plan, range_first, range_last)
+                                     for range_first, range_last in remaining_ranges)
+                if remaining_cost > 0:
+                    task_end = self._cost_model.advance(self._plan, first, last,
+                                                        remaining_cost / (self._guided_factor * self._workers))
+                else:
+                    # Nothing left has a cost, the chunks are shared out by amount as in GuidedSchedule
+                    remaining_chunks = sum(range_last - range_first for range_first, range_last in remaining_ranges)
+                    task_end = first + max(1, math.ceil(remaining_chunks / (self._guided_factor * self._workers)))
+                if self._max_chunks_per_task is not None:
+                    task_end = min(task_end, first + self._max_chunks_per_task)
+                task_end = min(task_end, last)
+                yield first, task_end
+                first = task_end
+
+
+class GridSearchExecutor:
+    def __init__(self, objective: Callable[[Point], float],
+                 reduction: Reduction,
+                 workers: int = None,
+                 max_chunk_size: int = 4096,
+                 guided_factor: int = 2,
+                 max_chunks_per_task: int = None,
+                 tasks_in_flight_per_worker: int = 2,
+                 precision: int = None,
+                 metrics: GridSearchMetrics = None,
+                 cost_model: CostModel = None):
+        self._objective = objective
+        self._reduction = reduction
+        self._workers = workers or os.cpu_count() or 1
+        self._max_chunk_size = max_chunk_size
+        self._guided_factor = guided_factor
+        self._max_chunks_per_task = max_chunks_per_task
+        self._tasks_in_flight = self._workers * tasks_in_flight_per_worker
+        self._precision = precision
+        self._pool: ProcessPoolExecutor | None = None
+        self._metrics = metrics
+        self._cost_model = cost_model
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    def __create_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self._workers,
+                                   initializer=_init_worker,
+                                   initargs=(self._objective, self._reduction, self._precision))
+
+    # The pool can be kept alive across runs by using the executor as a context manager
+    def __enter__(self) -> "GridSearchExecutor":
+        self._pool = self.__create_pool()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._pool.shutdown()
+        self._pool = None
+
+    def run(self, work: Work, journal_path: str = None) -> GridSearchResult:
+        plan = work.plan(self._max_chunk_size)
+        chunk_ranges = [(0, plan.amount_of_chunks)]
+        partial = self._reduction.identity()
+        if journal_path is None:
+            return self.__run([work], [chunk_ranges], partial, None)
+
+        # Chunks finished by a previous run are skipped and their partial result is reused
+        with ProgressJournal(journal_path, work, self._max_chunk_size, self._reduction) as journal:
+            return self.__run([work], [journal.missing(plan.amount_of_chunks)], journal.partial, journal)
+
+    def run_all(self, works: List[Work]) -> GridSearchResult:
+        chunk_ranges = [[(0, work.plan(self._max_chunk_size).amount_of_chunks)] for work in works]
+        return self.__run(works, chunk_ranges, self._reduction.identity(), None)
+
+    def __schedule(self, works: List[Work], chunk_ranges: List[List[Tuple[int, int]]]) \
+            -> Iterator[Tuple[Work, int, int, int]]:
+        for work, work_chunk_ranges in zip(works, chunk_ranges):
+            if self._cost_model is None:
+                schedule = GuidedSchedule(work_chunk_ranges, self._workers, self._guided_factor,
+                                          self._max_chunks_per_task)
+            else:
+                schedule = CostWeightedSchedule(work.plan(self._max_chunk_size), work_chunk_ranges, self._cost_model,
+                                                self._workers, self._guided_factor, self._max_chunks_per_task)
+            for first_chunk, last_chunk in schedule:
+                yield work, self._max_chunk_size, first_chunk, last_chunk
+
+    def __run(self, works: List[Work], chunk_ranges: List[List[Tuple[int, int]]], partial,
+              journal: ProgressJournal | None) -> GridSearchResult:
+        worker_stats: Dict[int, WorkerStats] = {}
+        points = 0
+        start_time = time.perf_counter()
+
+        # Tasks are submitted lazily with a bounded amount in flight: idle processes pull the next
+        # task from the shared queue, so slow regions never leave other cores waiting
+        tasks = self.__schedule(works, chunk_ranges)
+        pool = self._pool or self.__create_pool()
+        submitted_at = {}
+        submitted_works = {}
+
+        def submit(task):
+            future = pool.submit(_evaluate_chunks_in_worker, *task)
+            submitted_at[future] = time.time()
+            submitted_works[future] = task[0]
+            return future
+
+        with nullcontext() if self._pool else pool:
+            pending = set()
+            for task in tasks:
+                pending.add(submit(task))
+                if len(pending) >= self._tasks_in_flight:
+                    break
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk_result = future.result()
+                    if self._metrics is not None:
+                        self._metrics.record_task(chunk_result.worker, chunk_result.points,
+                                                  chunk_result.last_chunk - chunk_result.first_chunk,
+                                                  chunk_result.elapsed, chunk_result.split_time,
+                                                  chunk_result.started_at - submitted_at.pop(future))
+                    work = submitted_works.pop(future)
+                    if self._cost_model is not None:
+                        self._cost_model.observe(work.plan(self._max_chunk_size), chunk_result.first_chunk,
+                                                 chunk_result.last_chunk, chunk_result.elapsed)
+                    if journal is not None:
+                        journal.record(chunk_result.first_chunk, chunk_result.last_chunk, chunk_result.partial)
+                    partial = self._reduction.merge(partial, chunk_result.partial)
+                    points += chunk_result.points
+                    add_worker_stats(worker_stats, chunk_result)
+
+                    next_task = next(tasks, None)
+                    if next_task is not None:
+                        pending.add(submit(next_task))
+
+        return GridSearchResult(self._reduction.result(partial), points, time.perf_counter() - start_time,
+                                worker_stats)
+
+
+def griewank(point: Point) -> float:
+    total = 0.0
+    product = 1.0
+    for i, x in enumerate(point, start=1):
+        total += x * x / 4000
+        product *= math.cos(x / math.sqrt(i))
+    return total - product + 1
+
+
+def print_report(search_result: GridSearchResult):
+    print(f"Result: {search_result.result}")
+    print(f"Evaluated {search_result.points} points in {search_result.elapsed:.3f} s "
+          f"({search_result.throughput:,.0f} points/s)")
+    for worker, stats in sorted(search_result.worker_stats.items()):
+        print(f"Worker {worker}: {stats.points} points in {stats.tasks} tasks, "
+              f"{stats.busy_time:.3f} s busy ({stats.throughput:,.0f} points/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-w", "--workers",
+                        default=None,
+                        help="Amount of worker processes. Default is the amount of CPUs",
+                        type=int)
+    parser.add_argument("-n", "--points_per_dim",
+                        default=100,
+                        help="Amount of points on each interval of the searched work. Default is 100",
+                        type=int)
+    parser.add_argument("-d", "--dim",
+                        default=3,
+                        help="Amount of intervals of the searched work. Default is 3",
+                        type=int)
+    parser.add_argument("-c", "--max_chunk_size",
+                        default=4096,
+                        help="Maximum amount of points per chunk. Default is 4096",
+                        type=int)
+    parser.add_argument("-j", "--journal",
+                        default=None,
+                        help="Path of a progress journal used to resume an interrupted search. Default is no journal",
+                        type=str)
+    parser.add_argument("--metrics_port",
+                        default=None,
+                        help="Port where the metrics are served on /metrics. Default is not serving them",
+                        type=int)
+    parser.add_argument("--metrics_json",
+                        default=None,
+                        help="Path where a JSON summary of the metrics is written at the end. Default is none",
+                        type=str)
+    parser.add_argument("--learned_cost",
+                        action="store_true",
+                        help="Group chunks into tasks of similar cost, learned from the timings of finished tasks, "
+                             "instead of a similar amount of points")
+
+    args = parser.parse_args()
+    work = Work([Interval(-600, 600, 1200 / args.points_per_dim) for _ in range(args.dim)])
+    metrics = GridSearchMetrics()
+    executor = GridSearchExecutor(griewank, MinReduction(), workers=args.workers,
+                                  max_chunk_size=args.max_chunk_size, metrics=metrics,
+                                  cost_model=LearnedCostModel() if args.learned_cost else None)
+    with MetricsServer(metrics, args.metrics_port) if args.metrics_port is not None else nullcontext():
+        print_report(executor.run(work, journal_path=args.journal))
+    if args.metrics_json is not None:
+        metrics.write_json_summary(args.metrics_json)
+
+
+if __name__ == "__main__":
+    main()
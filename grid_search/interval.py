@@ -3,25 +3,83 @@ from typing import Iterator
 
 
 class Interval:
+    # Values are kept on an integer lattice: the k-th value is origin + (offset + k) * step.
+    # Sub-intervals share origin and step with their parent and only move offset and size,
+    # so splitting is exact and values never accumulate floating point error.
     def __init__(self, start, end, step):
-        self._start = start
-        self._end = end
+        self._origin = start
         self._step = step
-        self._size = math.ceil((end - start) / step)
+        self._offset = 0
+        self._size = self.__calc_size(start, end, step)
+
+    @staticmethod
+    def from_lattice(origin, step, offset: int, size: int) -> "Interval":
+        interval = Interval.__new__(Interval)
+        interval._origin = origin
+        interval._step = step
+        interval._offset = offset
+        interval._size = size
+        return interval
 
     def __repr__(self):
-        return f"[{self._start}, {self._end}, {self._step}]"
+        return f"[{self.start}, {self.end}, {self._step}]"
+
+    def __getitem__(self, index: int) -> int | float:
+        return self.value(index)
+
+    @staticmethod
+    def __calc_size(start, end, step) -> int:
+        steps = (end - start) / step
+        closest_integer = round(steps)
+        # An end that lies on the lattice is excluded even if the division drifted above it
+        if math.isclose(steps, closest_integer, rel_tol=1e-9, abs_tol=1e-9):
+            return max(closest_integer, 0)
+        return max(math.ceil(steps), 0)
 
     @property
     def size(self) -> int:
         return self._size
 
-    def unfold(self, precision: int = None) -> Iterator[int | float]:
-        i = self._start
-        while i < self._end:
-            yield self.__round_number(i, precision)
-            i = self.__round_number(i + self._step, precision)
+    @property
+    def start(self) -> int | float:
+        return self._origin + self._offset * self._step
+
+    @property
+    def end(self) -> int | float:
+        return self._origin + (self._offset + self._size) * self._step
+
+    @property
+    def step(self) -> int | float:
+        return self._step
+
+    @property
+    def origin(self) -> int | float:
+        return self._origin
+
+    @property
+    def offset(self) -> int:
+        return self._offset
 
+    def value(self, index: int, precision: int = None) -> int | float:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(f"Interval index {index} out of range for size {self._size}")
+        return self.__round_number(self._origin + (self._offset + index) * self._step, precision)
+
+    def sub_interval(self, start_index: int, stop_index: int) -> "Interval":
+        assert 0 <= start_index <= stop_index <= self._size
+        return Interval.from_lattice(self._origin, self._step, self._offset + start_index, stop_index - start_index)
+
+    def unfold(self, precision: int = None) -> Iterator[int | float]:
+        origin, step = self._origin, self._step
+        lattice_indices = range(self._offset, self._offset + self._size)
+        if precision is None:
+            for k in lattice_indices:
+                yield origin + k * step
+        else:
+            for k in lattice_indices:
+                yield round(origin + k * step, precision)
 
     @staticmethod
     def __round_number(x: int | float, precision: int | None) -> int | float:
@@ -29,31 +87,8 @@ class Interval:
             return x
         return round(x, precision)
 
-    def __split_evenly(self, amount_of_sub_intervals: int, precision: int = None) -> Iterator["Interval"]:
-        assert self.size % amount_of_sub_intervals == 0
-
+    def split(self, amount_of_sub_intervals: int) -> Iterator["Interval"]:
+        # Sub-interval sizes differ by at most one element
         for pos in range(amount_of_sub_intervals):
-            sub_start = self.__round_number(self._start + pos * self._size // amount_of_sub_intervals * self._step,
-                                            precision)
-            sub_end = self.__round_number(self._start + (pos + 1) * self._size // amount_of_sub_intervals * self._step,
-                                          precision)
-            yield Interval(sub_start, sub_end, self._step)
-        return
-
-    def split(self, amount_of_sub_intervals: int, precision: int = None) -> Iterator["Interval"]:
-        if self.size % amount_of_sub_intervals == 0:
-            yield from self.__split_evenly(amount_of_sub_intervals, precision)
-            return
-
-        max_elems_per_interval = math.ceil(self._size / amount_of_sub_intervals)
-        amount_of_sub_intervals_of_full_size = (self._size - amount_of_sub_intervals) // (max_elems_per_interval - 1)
-
-        sub_end = None
-        for pos in range(amount_of_sub_intervals_of_full_size):
-            sub_start = self.__round_number(self._start + pos * max_elems_per_interval * self._step, precision)
-            sub_end = self.__round_number(min(self._end, sub_start + max_elems_per_interval * self._step), precision)
-            yield Interval(sub_start, sub_end, self._step)
-
-        remaining_interval = Interval(sub_end, self._end, self._step)
-        remaining_amount_of_sub_intervals = amount_of_sub_intervals - amount_of_sub_intervals_of_full_size
-        yield from remaining_interval.split(remaining_amount_of_sub_intervals, precision)
+            yield self.sub_interval(pos * self._size // amount_of_sub_intervals,
+                                    (pos + 1) * self._size // amount_of_sub_intervals)
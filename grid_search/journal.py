@@ -0,0 +1,135 @@
+import os
+import pickle
+import struct
+import time
+from typing import List, Tuple
+
+from reduction import Reduction
+from work import Work
+
+RECORD_HEADER = struct.Struct("<I")
+
+ChunkRange = Tuple[int, int]
+
+
+def compact_ranges(ranges: List[ChunkRange]) -> List[ChunkRange]:
+    compacted = []
+    for first, last in sorted(ranges):
+        if compacted and first <= compacted[-1][1]:
+            compacted[-1] = (compacted[-1][0], max(compacted[-1][1], last))
+        else:
+            compacted.append((first, last))
+    return compacted
+
+
+def missing_ranges(completed: List[ChunkRange], amount_of_chunks: int) -> List[ChunkRange]:
+    missing = []
+    next_chunk = 0
+    for first, last in compact_ranges(completed):
+        if first > next_chunk:
+            missing.append((next_chunk, first))
+        next_chunk = max(next_chunk, last)
+    if next_chunk < amount_of_chunks:
+        missing.append((next_chunk, amount_of_chunks))
+    return missing
+
+
+class ProgressJournal:
+    # Append-only file of completed chunk ranges of a WorkPlan and their partial reductions.
+    # The first record identifies the work and chunk size it belongs to. Records are buffered
+    # and written in batches, and a journal is compacted to a single record when it is opened,
+    # so restarts neither replay nor grow an unbounded history.
+    def __init__(self, path: str, work: Work, max_chunk_size: int, reduction: Reduction,
+                 flush_every: int = 64, flush_interval: float = 1.0):
+        self._path = path
+        self._identity = (repr(work), max_chunk_size)
+        self._reduction = reduction
+        self._flush_every = flush_every
+        self._flush_interval = flush_interval
+
+        self._completed: List[ChunkRange] = []
+        self._partial = reduction.identity()
+        self._pending: List[bytes] = []
+        self._last_flush = time.monotonic()
+
+        self.__load()
+        self.__compact()
+        self._file = open(path, "ab")
+
+    @property
+    def completed(self) -> List[ChunkRange]:
+        return self._completed
+
+    @property
+    def partial(self):
+        return self._partial
+
+    def __load(self):
+        if not os.path.exists(self._path):
+            return
+
+        with open(self._path, "rb") as f:
+            data = f.read()
+
+        records = []
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            (size,) = RECORD_HEADER.unpack_from(data, offset)
+            offset += RECORD_HEADER.size
+            if offset + size > len(data):
+                # The last record was cut short by a crash while it was being written
+                break
+            records.append(pickle.loads(data[offset:offset + size]))
+            offset += size
+
+        if not records:
+            return
+        if records[0] != self._identity:
+            raise ValueError(f"Journal {self._path} belongs to a different work or chunk size")
+
+        completed = []
+        for ranges, partial in records[1:]:
+            completed.extend(ranges)
+            self._partial = self._reduction.merge(self._partial, partial)
+        self._completed = compact_ranges(completed)
+
+    @staticmethod
+    def __encode_record(record) -> bytes:
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        return RECORD_HEADER.pack(len(payload)) + payload
+
+    def __compact(self):
+        temporary_path = f"{self._path}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(self.__encode_record(self._identity))
+            if self._completed:
+                f.write(self.__encode_record((self._completed, self._partial)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self._path)
+
+    def missing(self, amount_of_chunks: int) -> List[ChunkRange]:
+        return missing_ranges(self._completed, amount_of_chunks)
+
+    def record(self, first_chunk: int, last_chunk: int, partial):
+        self._pending.append(self.__encode_record(([(first_chunk, last_chunk)], partial)))
+        if len(self._pending) >= self._flush_every or time.monotonic() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._file.write(b"".join(self._pending))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending.clear()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self) -> "ProgressJournal":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
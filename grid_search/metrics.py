@@ -0,0 +1,203 @@
+import json
+import math
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: LabelValues, extra: str = "") -> str:
+    labels = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values: str):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_number(value)}")
+        return lines
+
+    def summary(self) -> Dict[str, float]:
+        return {",".join(label_values) or "total": value for label_values, value in sorted(self.values().items())}
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            counts = self._counts.get(label_values)
+            if counts is None:
+                counts = self._counts[label_values] = [0] * len(self._buckets)
+                self._sums[label_values] = 0.0
+            for pos, bound in enumerate(self._buckets):
+                if value <= bound:
+                    counts[pos] += 1
+                    break
+            self._sums[label_values] += value
+
+    def __snapshot(self) -> List[Tuple[LabelValues, List[int], float]]:
+        with self._lock:
+            return [(label_values, list(counts), self._sums[label_values])
+                    for label_values, counts in sorted(self._counts.items())]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, counts, total in self.__snapshot():
+            cumulative = 0
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.label_names, label_values, f'le="{_format_number(bound)}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def __quantile(self, counts: List[int], quantile: float) -> float:
+        # Upper bound of the bucket holding the quantile, as precise as the buckets allow
+        target = quantile * sum(counts)
+        cumulative = 0
+        for bound, count in zip(self._buckets, counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return math.inf
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for label_values, counts, total in self.__snapshot():
+            count = sum(counts)
+            summary[",".join(label_values) or "total"] = {
+                "count": count,
+                "sum": total,
+                "mean": total / count if count else 0.0,
+                "p50": self.__quantile(counts, 0.5),
+                "p99": self.__quantile(counts, 0.99),
+            }
+        return summary
+
+
+class GridSearchMetrics:
+    # Metrics are updated once per task with the totals of its chunks, never per point, so they
+    # can stay enabled in production runs
+    def __init__(self):
+        self.points = Counter("grid_search_points_evaluated_total", "Points evaluated", ("worker",))
+        self.chunks = Counter("grid_search_chunks_evaluated_total", "Chunks evaluated", ("worker",))
+        self.busy_seconds = Counter("grid_search_worker_busy_seconds_total", "Time spent evaluating chunks",
+                                    ("worker",))
+        self.task_latency = Histogram("grid_search_task_latency_seconds", "Time to evaluate a task of chunks")
+        self.split_seconds = Histogram("grid_search_split_seconds", "Time to build the chunks of a task")
+        self.queue_wait = Histogram("grid_search_queue_wait_seconds", "Time a task waited before starting")
+        self._start_time = time.time()
+
+    def __all(self) -> List[Counter | Histogram]:
+        return [self.points, self.chunks, self.busy_seconds, self.task_latency, self.split_seconds, self.queue_wait]
+
+    def record_task(self, worker: int, points: int, chunks: int, elapsed: float, split_time: float,
+                    queue_wait: float):
+        worker = str(worker)
+        self.points.inc(points, worker)
+        self.chunks.inc(chunks, worker)
+        self.busy_seconds.inc(elapsed, worker)
+        self.task_latency.observe(elapsed)
+        self.split_seconds.observe(split_time)
+        self.queue_wait.observe(max(queue_wait, 0.0))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.__all():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict:
+        elapsed = time.time() - self._start_time
+        points = self.points.values()
+        busy_seconds = self.busy_seconds.values()
+        throughputs = {worker[0]: points[worker] / busy_seconds[worker]
+                       for worker in points if busy_seconds.get(worker)}
+        mean_throughput = statistics.mean(throughputs.values()) if throughputs else 0.0
+        return {
+            "elapsed_seconds": elapsed,
+            "points": sum(points.values()),
+            "combined_throughput": sum(points.values()) / elapsed if elapsed > 0 else 0.0,
+            "per_worker_throughput": throughputs,
+            "throughput_coefficient_of_variation":
+                statistics.pstdev(throughputs.values()) / mean_throughput if mean_throughput else 0.0,
+            "metrics": {metric.name: metric.summary() for metric in self.__all()},
+        }
+
+    def write_json_summary(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+class MetricsServer:
+    # Serves the metrics in the Prometheus text format on /metrics from a background thread
+    def __init__(self, metrics: GridSearchMetrics, port: int = 9100, host: str = "0.0.0.0"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def __enter__(self) -> "MetricsServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
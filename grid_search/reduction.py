@@ -0,0 +1,107 @@
+import heapq
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, List, Tuple, TypeVar, Generic
+
+P = TypeVar("P")
+
+Point = List[int | float]
+
+
+class Reduction(ABC, Generic[P]):
+    # Partial results must be picklable: they are merged across processes and nodes
+    @abstractmethod
+    def identity(self) -> P:
+        pass
+
+    @abstractmethod
+    def accumulate(self, partial: P, value: float, point: Point) -> P:
+        pass
+
+    @abstractmethod
+    def merge(self, partial: P, other: P) -> P:
+        pass
+
+    def result(self, partial: P):
+        return partial
+
+    def reduce_points(self, partial: P, objective: Callable[[Point], float], points: Iterable[Point]) -> P:
+        for point in points:
+            partial = self.accumulate(partial, objective(point), point)
+        return partial
+
+
+class MinReduction(Reduction[Tuple[float, Point] | None]):
+    def identity(self) -> Tuple[float, Point] | None:
+        return None
+
+    def accumulate(self, partial, value, point):
+        if partial is None or value < partial[0]:
+            return value, list(point)
+        return partial
+
+    def merge(self, partial, other):
+        if partial is None:
+            return other
+        if other is None:
+            return partial
+        return other if other[0] < partial[0] else partial
+
+
+class MaxReduction(Reduction[Tuple[float, Point] | None]):
+    def identity(self) -> Tuple[float, Point] | None:
+        return None
+
+    def accumulate(self, partial, value, point):
+        if partial is None or value > partial[0]:
+            return value, list(point)
+        return partial
+
+    def merge(self, partial, other):
+        if partial is None:
+            return other
+        if other is None:
+            return partial
+        return other if other[0] > partial[0] else partial
+
+
+class SumReduction(Reduction[float]):
+    def identity(self) -> float:
+        return 0
+
+    def accumulate(self, partial, value, point):
+        return partial + value
+
+    def merge(self, partial, other):
+        return partial + other
+
+    def reduce_points(self, partial, objective, points):
+        return partial + sum(objective(point) for point in points)
+
+
+class TopKReduction(Reduction[List[Tuple[float, Point]]]):
+    # Keeps the k smallest values (or the k largest ones) together with their points.
+    # The partial result is a heap whose root is the worst value kept.
+    def __init__(self, k: int, largest: bool = False):
+        if k < 1:
+            raise ValueError(f"k must be positive, got {k}")
+        self._k = k
+        self._sign = 1 if largest else -1
+
+    def identity(self) -> List[Tuple[float, Point]]:
+        return []
+
+    def accumulate(self, partial, value, point):
+        if len(partial) < self._k:
+            heapq.heappush(partial, (self._sign * value, list(point)))
+        elif self._sign * value > partial[0][0]:
+            heapq.heapreplace(partial, (self._sign * value, list(point)))
+        return partial
+
+    def merge(self, partial, other):
+        for signed_value, point in other:
+            self.accumulate(partial, self._sign * signed_value, point)
+        return partial
+
+    def result(self, partial) -> List[Tuple[float, Point]]:
+        best_first = sorted(partial, key=lambda entry: entry[0], reverse=True)
+        return [(self._sign * signed_value, point) for signed_value, point in best_first]
@@ -1,33 +1,387 @@
+import math
+import multiprocessing
+import os
+import random
+import time
+import urllib.request
 from typing import TypeVar
 
+from adaptive_search import AdaptiveGridSearch
+from benchmark import check_split, random_work
+from cost_model import CallableCostModel, CostModel, LearnedCostModel
+from distributed import HELLO, GridSearchManager, connect, create_listener, recv_message, run_worker, send_message
+from executor import CostWeightedSchedule, GridSearchExecutor, evaluate_chunks
 from interval import Interval
+from journal import ProgressJournal
+from metrics import GridSearchMetrics, MetricsServer
+from reduction import MinReduction, MaxReduction, Reduction, SumReduction, TopKReduction
+from wire_format import decode_work, decode_works, encode_work, encode_works
 from work import Work
 
 T = TypeVar("T")
 
 
 def assert_work_is_split_correctly(work: Work, max_chunk_size: int):
+    check_split(work, max_chunk_size)
+    print("Work is split correctly")
+
+
+def assert_random_works_are_split_correctly(seed: int, amount_of_works: int):
+    rng = random.Random(seed)
+    for _ in range(amount_of_works):
+        work = random_work(rng, max_dim=4, max_points_per_dim=12)
+        check_split(work, rng.randint(1, work.size + 1))
+    print("Random works are split correctly")
+
+
+def assert_interval_is_split_exactly(interval: Interval, amount_of_sub_intervals: int, expected_size: int):
+    if interval.size != expected_size:
+        raise AssertionError(f"Interval {interval} has {interval.size} elements, expected {expected_size}")
+
+    unfolded_sub_intervals = []
+    for sub_interval in interval.split(amount_of_sub_intervals):
+        unfolded_sub_intervals += list(sub_interval.unfold())
+
+    if unfolded_sub_intervals != list(interval.unfold()):
+        raise AssertionError(f"Sub intervals of {interval} unfold to {unfolded_sub_intervals}")
+    print("Interval is split exactly")
+
+
+def assert_work_plan_is_indexed_correctly(work: Work, max_chunk_size: int):
+    plan = work.plan(max_chunk_size)
     unfolded_work = list(work.unfold(precision=10))
-    unfolded_work_length = len(unfolded_work)
-    sub_works = list(work.split(max_chunk_size, precision=10))
-    unfolded_sub_works = []
-    for sub_work in sub_works:
-        unfolded_sub_work = list(sub_work.unfold(precision=10))
-        unfolded_sub_works += unfolded_sub_work
-
-    for work_unit in unfolded_work:
-        try:
-            unfolded_sub_works.remove(work_unit)
-        except ValueError:
-            raise AssertionError(f"Work unit {work_unit} is not in the list of sub works {unfolded_sub_works}")
-
-    if unfolded_sub_works:
-        remaining_work_length = len(unfolded_sub_works)
-        remaining_percentage = remaining_work_length / unfolded_work_length * 100
-        print(
-            f"WARNING: Sub works have extra work units not found in the original work ({remaining_percentage}% of the original work")
+
+    for index, work_unit in enumerate(unfolded_work):
+        if work.point(index, precision=10) != work_unit:
+            raise AssertionError(f"Work unit {index} of {work} is {work.point(index, precision=10)}, expected {work_unit}")
+    if len(work) != len(unfolded_work) or [work[index] for index in range(len(work))] != list(work):
+        raise AssertionError(f"Work {work} is not a sequence of its {len(unfolded_work)} units")
+
+    expected_start = 0
+    for chunk_index in range(len(plan)):
+        chunk = plan[chunk_index]
+        start, stop = plan.index_range(chunk_index)
+        if start != expected_start:
+            raise AssertionError(f"Chunk {chunk_index} of {work} starts at {start}, expected {expected_start}")
+        if chunk.size > max_chunk_size or chunk.size != stop - start:
+            raise AssertionError(f"Chunk {chunk_index} of {work} has {chunk.size} units for range {start, stop}")
+        if list(chunk.unfold(precision=10)) != unfolded_work[start:stop]:
+            raise AssertionError(f"Chunk {chunk_index} of {work} does not match the units in range {start, stop}")
+        expected_start = stop
+
+    if expected_start != work.size:
+        raise AssertionError(f"Chunks of {work} cover {expected_start} units, expected {work.size}")
+    print("Work plan is indexed correctly")
+
+
+def assert_wire_format_round_trips(work: Work, max_chunk_size: int):
+    sub_works = list(work.split(max_chunk_size))
+    decoded_sub_works = decode_works(encode_works(sub_works)) + [decode_work(encode_work(work))]
+
+    for sub_work, decoded_sub_work in zip(sub_works + [work], decoded_sub_works):
+        if list(sub_work.unfold()) != list(decoded_sub_work.unfold()):
+            raise AssertionError(f"Sub work {sub_work} was decoded as {decoded_sub_work}")
+    print("Wire format round trips")
+
+
+def assert_work_is_unfolded_with_changes_correctly(work: Work):
+    unfolded_work = list(work.unfold())
+
+    previous_point = None
+    unfolded_with_changes = []
+    for point, changed_position in work.unfold_with_changes():
+        if previous_point is not None and (point[:changed_position] != previous_point[:changed_position]):
+            raise AssertionError(f"Point {point} changed before position {changed_position} from {previous_point}")
+        previous_point = list(point)
+        unfolded_with_changes.append(previous_point)
+    if unfolded_with_changes != unfolded_work:
+        raise AssertionError(f"Work {work} unfolded with changes to {unfolded_with_changes}")
+
+    previous_point = None
+    unfolded_in_gray_order = set()
+    for point, changed_position in work.unfold_with_changes(gray=True):
+        if previous_point is not None:
+            changed_positions = [pos for pos in range(work.dim) if point[pos] != previous_point[pos]]
+            if changed_positions != [changed_position]:
+                raise AssertionError(f"Gray step from {previous_point} to {point} changed {changed_positions}")
+        previous_point = list(point)
+        unfolded_in_gray_order.add(tuple(point))
+    if len(unfolded_in_gray_order) != work.size or unfolded_in_gray_order != set(map(tuple, unfolded_work)):
+        raise AssertionError(f"Work {work} unfolded in gray order to {unfolded_in_gray_order}")
+    print("Work is unfolded with changes correctly")
+
+
+def assert_work_is_unfolded_in_batches_correctly(work: Work, batch_size: int, precision: int = None):
+    unfolded_work = [list(point) for point in work.unfold(precision)]
+    batches = list(work.unfold_batches(batch_size, precision))
+    if any(len(batch) != batch_size for batch in batches[:-1]) or not 0 < len(batches[-1]) <= batch_size:
+        raise AssertionError(f"Work {work} unfolded in batches of sizes {[len(batch) for batch in batches]}")
+    unfolded_in_batches = [point.tolist() for batch in batches for point in batch]
+    if len(unfolded_in_batches) != len(unfolded_work):
+        raise AssertionError(f"Work {work} unfolded in {len(unfolded_in_batches)} points instead of {work.size}")
+    for point, batched_point in zip(unfolded_work, unfolded_in_batches):
+        if point != batched_point:
+            raise AssertionError(f"Work {work} unfolded {point} in batches as {batched_point}")
+    print("Work is unfolded in batches correctly")
+
+
+def assert_random_works_are_unfolded_in_batches_correctly(seed: int, amount_of_works: int):
+    rng = random.Random(seed)
+    for _ in range(amount_of_works):
+        work = random_work(rng, max_dim=3, max_points_per_dim=12)
+        for precision in [None, 0, 1, 2, 3]:
+            assert_work_is_unfolded_in_batches_correctly(work, rng.randint(1, work.size + 1), precision)
+
+
+def squared_distance_to_center(point):
+    return sum((x - 1) ** 2 for x in point)
+
+
+def assert_executor_reduces_correctly(work: Work, max_chunk_size: int, cost_model: CostModel = None):
+    values = sorted((squared_distance_to_center(point), point) for point in work.unfold())
+    expected_results = [
+        (MinReduction(), values[0]),
+        (MaxReduction(), values[-1]),
+        (SumReduction(), sum(value for value, _ in values)),
+        (TopKReduction(3), values[:3]),
+    ]
+
+    for reduction, expected_result in expected_results:
+        executor = GridSearchExecutor(squared_distance_to_center, reduction, workers=2, max_chunk_size=max_chunk_size,
+                                      cost_model=cost_model)
+        search_result = executor.run(work)
+        if search_result.points != work.size:
+            raise AssertionError(f"Executor evaluated {search_result.points} points of {work}, expected {work.size}")
+        if search_result.result != expected_result:
+            raise AssertionError(f"Executor reduced {work} to {search_result.result}, expected {expected_result}")
+    print("Executor reduces correctly")
+
+
+def assert_metrics_are_exported(work: Work, max_chunk_size: int):
+    metrics = GridSearchMetrics()
+    executor = GridSearchExecutor(squared_distance_to_center, MinReduction(), workers=2,
+                                  max_chunk_size=max_chunk_size, metrics=metrics)
+    with MetricsServer(metrics, port=0, host="127.0.0.1") as server:
+        executor.run(work)
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            exported = response.read().decode()
+
+    exported_points = 0
+    for line in exported.splitlines():
+        if line.startswith("grid_search_points_evaluated_total{"):
+            exported_points += float(line.split()[-1])
+    if exported_points != work.size:
+        raise AssertionError(f"Metrics exported {exported_points} evaluated points, expected {work.size}")
+    if "grid_search_task_latency_seconds_count" not in exported or metrics.summary()["points"] != work.size:
+        raise AssertionError(f"Metrics are missing from the export {exported}")
+    print("Metrics are exported")
+
+
+def assert_executor_resumes_from_journal(work: Work, max_chunk_size: int, journal_path: str):
+    expected_result = min((squared_distance_to_center(point), point) for point in work.unfold())
+    plan = work.plan(max_chunk_size)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+
+    # Simulates a run that was interrupted after finishing the even chunks
+    journal = ProgressJournal(journal_path, work, max_chunk_size, MinReduction(), flush_every=2)
+    finished_points = 0
+    for chunk_index in range(0, plan.amount_of_chunks, 2):
+        chunk_result = evaluate_chunks(plan, chunk_index, chunk_index + 1, squared_distance_to_center, MinReduction())
+        journal.record(chunk_index, chunk_index + 1, chunk_result.partial)
+        finished_points += chunk_result.points
+    journal.close()
+
+    executor = GridSearchExecutor(squared_distance_to_center, MinReduction(), workers=2, max_chunk_size=max_chunk_size)
+    search_result = executor.run(work, journal_path=journal_path)
+    if search_result.points != work.size - finished_points:
+        raise AssertionError(f"Resumed executor evaluated {search_result.points} points, "
+                             f"expected {work.size - finished_points}")
+    if search_result.result != expected_result:
+        raise AssertionError(f"Resumed executor reduced {work} to {search_result.result}, expected {expected_result}")
+
+    search_result = executor.run(work, journal_path=journal_path)
+    if search_result.points != 0 or search_result.result != expected_result:
+        raise AssertionError(f"Finished journal evaluated {search_result.points} points again")
+    os.remove(journal_path)
+    print("Executor resumes from journal")
+
+
+def assert_adaptive_search_finds_minimum(work: Work, keep: int, branching: int):
+    expected_result = min((squared_distance_to_center(point), point) for point in work.unfold())
+    search = AdaptiveGridSearch(squared_distance_to_center, keep=keep, branching=branching, workers=2)
+    search_result = search.search(work)
+    if search_result.best[0] != expected_result:
+        raise AssertionError(f"Adaptive search found {search_result.best[0]} in {work}, expected {expected_result}")
+    if search_result.evaluations >= work.size:
+        raise AssertionError(f"Adaptive search used {search_result.evaluations} evaluations for {work.size} points")
+    print("Adaptive search finds minimum")
+
+
+def wavy(point):
+    return sum(x * math.sin(x) for x in point)
+
+
+def assert_adaptive_search_reports_evaluated_values(work: Work, keep: int, branching: int):
+    search = AdaptiveGridSearch(wavy, keep=keep, branching=branching, workers=2)
+    for value, point in search.search(work).best:
+        if wavy(point) != value:
+            raise AssertionError(f"Adaptive search reported {value} at {point} in {work}, objective is {wavy(point)}")
+    print("Adaptive search reports evaluated values")
+
+
+def assert_random_adaptive_searches_report_evaluated_values(seed: int, amount_of_works: int):
+    rng = random.Random(seed)
+    for _ in range(amount_of_works):
+        work = Work([Interval(start, start + rng.uniform(5, 60), rng.choice([1, 0.5, 0.3]))
+                     for start in (rng.uniform(-50, 10) for _ in range(rng.randint(1, 3)))])
+        assert_adaptive_search_reports_evaluated_values(work, rng.randint(2, 5), rng.randint(2, 6))
+
+
+def assert_manager_reduces_correctly(work: Work, max_chunk_size: int, address, cost_model: CostModel = None):
+    expected_result = min((squared_distance_to_center(point), point) for point in work.unfold())
+    manager = GridSearchManager(squared_distance_to_center, MinReduction(), max_chunk_size=max_chunk_size,
+                                cost_model=cost_model)
+    search_result = manager.run(work, address, workers=3)
+    if search_result.points != work.size:
+        raise AssertionError(f"Manager evaluated {search_result.points} points of {work}, expected {work.size}")
+    if search_result.result != expected_result:
+        raise AssertionError(f"Manager reduced {work} to {search_result.result}, expected {expected_result}")
+    print("Manager reduces correctly")
+
+
+def assert_listener_keeps_other_files(path: str):
+    with open(path, "w") as f:
+        f.write("not a socket")
+    try:
+        create_listener(path, 1).close()
+    except FileExistsError:
+        pass
     else:
-        print("Work is split correctly")
+        raise AssertionError(f"Listener was bound over the file {path}")
+    finally:
+        with open(path) as f:
+            content = f.read()
+        os.remove(path)
+    if content != "not a socket":
+        raise AssertionError(f"File {path} was changed by the listener")
+    print("Listener keeps other files")
+
+
+def assert_manager_rejects_materializing_cost_model():
+    try:
+        GridSearchManager(squared_distance_to_center, MinReduction(), cost_model=CallableCostModel(skewed_cost))
+    except ValueError:
+        print("Manager rejects materializing cost model")
+        return
+    raise AssertionError("Manager accepted a cost model that builds every chunk of the plan")
+
+
+def run_dying_worker(address):
+    # Takes a task and dies without answering it, leaving the tasks sent after it unread
+    sock = connect(address)
+    send_message(sock, HELLO, os.getpid())
+    recv_message(sock)
+    recv_message(sock)
+    time.sleep(0.1)
+    os._exit(1)
+
+
+def assert_manager_survives_dying_worker(work: Work, max_chunk_size: int, address: str):
+    expected_result = min((squared_distance_to_center(point), point) for point in work.unfold())
+    processes = [multiprocessing.Process(target=run_dying_worker, args=(address,))]
+    processes.extend(multiprocessing.Process(target=run_worker, args=(address,)) for _ in range(2))
+    for process in processes:
+        process.start()
+    manager = GridSearchManager(squared_distance_to_center, MinReduction(), max_chunk_size=max_chunk_size,
+                                accept_timeout=10)
+    search_result = manager.run(work, address, workers=len(processes), spawn_local_workers=False)
+    for process in processes:
+        process.join(10)
+        if process.is_alive():
+            process.terminate()
+            raise AssertionError("Worker was not stopped after the run")
+    if search_result.points != work.size or search_result.result != expected_result:
+        raise AssertionError(f"Manager reduced {work} to {search_result.result} over {search_result.points} points "
+                             f"after a worker died, expected {expected_result} over {work.size}")
+    print("Manager survives dying worker")
+
+
+def distance_failing_at_center(point):
+    if all(x == 1 for x in point):
+        raise ValueError(f"Objective failed at {point}")
+    return squared_distance_to_center(point)
+
+
+def assert_manager_fails_when_objective_raises(work: Work, max_chunk_size: int):
+    # Every worker that takes the failing task dies, the run ends with an error instead of hanging
+    manager = GridSearchManager(distance_failing_at_center, MinReduction(), max_chunk_size=max_chunk_size,
+                                accept_timeout=10, shutdown_timeout=5)
+    start_time = time.perf_counter()
+    try:
+        manager.run(work, ("127.0.0.1", 0), workers=3)
+    except ConnectionError:
+        print(f"Manager fails when objective raises ({time.perf_counter() - start_time:.1f} s)")
+        return
+    raise AssertionError(f"Manager finished {work} although the objective raises")
+
+
+class IncompleteReduction(Reduction):
+    def identity(self):
+        return None
+
+
+def assert_incomplete_subclasses_fail_on_creation():
+    for incomplete in (IncompleteReduction, CostModel):
+        try:
+            incomplete()
+        except TypeError:
+            continue
+        raise AssertionError(f"{incomplete.__name__} was created without all its abstract methods")
+    print("Incomplete subclasses fail on creation")
+
+
+def skewed_cost(chunk: Work) -> float:
+    # Points with a negative first value are 10 times as expensive
+    return chunk.size * (10 if chunk.intervals[0].start < 0 else 1)
+
+
+def assert_schedule_balances_cost(work: Work, max_chunk_size: int, cost_model: CostModel, workers: int):
+    plan = work.plan(max_chunk_size)
+    max_chunk_cost = max(skewed_cost(chunk) for chunk in plan)
+    remaining_cost = sum(skewed_cost(chunk) for chunk in plan)
+    expected_first = 0
+    for first_chunk, last_chunk in CostWeightedSchedule(plan, [(0, plan.amount_of_chunks)], cost_model, workers):
+        if first_chunk != expected_first or last_chunk <= first_chunk:
+            raise AssertionError(f"Task {first_chunk, last_chunk} of {work} does not follow chunk {expected_first}")
+        task_cost = sum(skewed_cost(plan[chunk_index]) for chunk_index in range(first_chunk, last_chunk))
+        # Guided share of the remaining cost, up to the last chunk that crosses it
+        budget = remaining_cost / (2 * workers)
+        if last_chunk - first_chunk > 1 and task_cost > budget + max_chunk_cost:
+            raise AssertionError(f"Task {first_chunk, last_chunk} of {work} costs {task_cost}, share is {budget}")
+        remaining_cost -= task_cost
+        expected_first = last_chunk
+    if expected_first != plan.amount_of_chunks:
+        raise AssertionError(f"Tasks of {work} cover {expected_first} chunks, expected {plan.amount_of_chunks}")
+    print("Schedule balances cost")
+
+
+def assert_cost_model_is_learned(work: Work, max_chunk_size: int, regions: int):
+    plan = work.plan(max_chunk_size)
+    cost_model = LearnedCostModel(regions)
+    for chunk_index in range(plan.amount_of_chunks):
+        cost_model.observe(plan, chunk_index, chunk_index + 1, skewed_cost(plan[chunk_index]))
+
+    total_cost = sum(skewed_cost(chunk) for chunk in plan)
+    if not math.isclose(cost_model.range_cost(plan, 0, plan.amount_of_chunks), total_cost):
+        raise AssertionError(f"Learned cost of {work} is {cost_model.range_cost(plan, 0, plan.amount_of_chunks)}, "
+                             f"expected {total_cost}")
+    for chunk_index in (0, plan.amount_of_chunks - 1):
+        learned_cost = cost_model.range_cost(plan, chunk_index, chunk_index + 1)
+        if not math.isclose(learned_cost, skewed_cost(plan[chunk_index])):
+            raise AssertionError(f"Learned cost of chunk {chunk_index} of {work} is {learned_cost}, "
+                                 f"expected {skewed_cost(plan[chunk_index])}")
+    print("Cost model is learned")
 
 
 def run_tests():
@@ -72,6 +426,106 @@ def run_tests():
               Interval(-8, 4, 2),
               Interval(3, 12, 3)]), 5)
 
+    assert_random_works_are_split_correctly(seed=42, amount_of_works=300)
+
+    assert_interval_is_split_exactly(Interval(0, 10, 1), 3, 10)
+    assert_interval_is_split_exactly(Interval(0, 0.9, 0.3), 2, 3)
+    assert_interval_is_split_exactly(Interval(3, 3.3, 0.1), 3, 3)
+    assert_interval_is_split_exactly(Interval(-6.5, -5, 0.01), 7, 150)
+    assert_interval_is_split_exactly(Interval(0, 10, 4.3), 3, 3)
+
+    assert_work_plan_is_indexed_correctly(Work([Interval(0, 10, 1)]), 3)
+    assert_work_plan_is_indexed_correctly(Work([Interval(0, 10, 1),
+                                                Interval(0, 10, 1)]), 35)
+    assert_work_plan_is_indexed_correctly(Work([Interval(0, 3, 1),
+                                                Interval(0, 3, 1),
+                                                Interval(0, 3, 1)]), 2)
+    assert_work_plan_is_indexed_correctly(Work([Interval(0, 10, 1),
+                                                Interval(0, 10, 1),
+                                                Interval(0, 10, 1)]), 13)
+    assert_work_plan_is_indexed_correctly(
+        Work([Interval(0, 12.3, 8.4),
+              Interval(5.3, 8.99, 1.2),
+              Interval(3, 3.3, 0.1)]), 5)
+    assert_work_plan_is_indexed_correctly(
+        Work([Interval(0, 12, 3),
+              Interval(-8, 4, 2),
+              Interval(3, 12, 3)]), 1000)
+
+    assert_wire_format_round_trips(Work([Interval(0, 10, 1)]), 3)
+    assert_wire_format_round_trips(
+        Work([Interval(0, 12.3, 8.4),
+              Interval(5.3, 8.99, 1.2),
+              Interval(3, 3.3, 0.1),
+              Interval(-10, 0, 3)]), 5)
+
+    assert_work_is_unfolded_with_changes_correctly(Work([Interval(0, 4, 1)]))
+    assert_work_is_unfolded_with_changes_correctly(Work([Interval(0, 3, 1),
+                                                         Interval(0, 1, 1),
+                                                         Interval(-1, 1, 0.5)]))
+    assert_work_is_unfolded_with_changes_correctly(
+        Work([Interval(0, 12.3, 8.4),
+              Interval(5.3, 8.99, 1.2),
+              Interval(3, 3.3, 0.1)]))
+
+    assert_work_is_unfolded_in_batches_correctly(Work([Interval(0, 10, 1)]), 3)
+    assert_work_is_unfolded_in_batches_correctly(Work([Interval(-10, 0, 3),
+                                                       Interval(0, 4, 1)]), 5, 2)
+    assert_work_is_unfolded_in_batches_correctly(Work([Interval(2.675, 3, 1)]), 4, 2)
+    assert_work_is_unfolded_in_batches_correctly(Work([Interval(0, 1, 0.005)]), 7, 2)
+    assert_work_is_unfolded_in_batches_correctly(
+        Work([Interval(0, 12.3, 8.4),
+              Interval(5.3, 8.99, 1.2),
+              Interval(3, 3.3, 0.1)]), 4)
+    assert_work_is_unfolded_in_batches_correctly(
+        Work([Interval(-6.5, -5, 0.01),
+              Interval(1.005, 2.015, 0.01)]), 1000, 2)
+    assert_random_works_are_unfolded_in_batches_correctly(seed=3, amount_of_works=100)
+
+    assert_incomplete_subclasses_fail_on_creation()
+    assert_executor_reduces_correctly(Work([Interval(-5, 5, 1),
+                                            Interval(-3, 4.5, 0.5)]), 7)
+    assert_metrics_are_exported(Work([Interval(-5, 5, 1),
+                                      Interval(-3, 4.5, 0.5)]), 7)
+    assert_executor_resumes_from_journal(Work([Interval(-5, 5, 1),
+                                               Interval(-3, 4.5, 0.5)]), 7, "grid_search_tests.journal")
+    assert_adaptive_search_finds_minimum(Work([Interval(-5, 5, 0.25),
+                                               Interval(-8, 8, 0.5)]), 2, 4)
+    assert_adaptive_search_finds_minimum(Work([Interval(-10, 10, 1),
+                                               Interval(-3, 4.5, 0.5),
+                                               Interval(0, 3, 0.125)]), 3, 3)
+    assert_adaptive_search_reports_evaluated_values(Work([Interval(-3.61, 49.38, 1)]), 5, 5)
+    assert_random_adaptive_searches_report_evaluated_values(seed=7, amount_of_works=20)
+    assert_manager_reduces_correctly(Work([Interval(-5, 5, 1),
+                                           Interval(-3, 4.5, 0.5)]), 7, ("127.0.0.1", 0))
+    assert_manager_reduces_correctly(Work([Interval(-5, 5, 1),
+                                           Interval(-3, 4.5, 0.5),
+                                           Interval(0, 2, 0.25)]), 5, "grid_search_tests.sock")
+    assert_manager_survives_dying_worker(Work([Interval(-5, 5, 1),
+                                               Interval(-3, 4.5, 0.5),
+                                               Interval(0, 2, 0.25)]), 5, "grid_search_tests.sock")
+    assert_manager_fails_when_objective_raises(Work([Interval(-5, 5, 1),
+                                                     Interval(-3, 4.5, 0.5)]), 7)
+
+    assert_schedule_balances_cost(Work([Interval(-10, 10, 1),
+                                        Interval(0, 5, 0.5)]), 7, CallableCostModel(skewed_cost), 3)
+    assert_schedule_balances_cost(Work([Interval(-10, 10, 0.5),
+                                        Interval(-3, 4.5, 0.5),
+                                        Interval(0, 3, 1)]), 11, CallableCostModel(skewed_cost), 4)
+    assert_cost_model_is_learned(Work([Interval(-10, 10, 1),
+                                       Interval(0, 5, 0.5)]), 5, 20)
+    assert_cost_model_is_learned(Work([Interval(-10, 10, 0.5),
+                                       Interval(-3, 4.5, 0.5),
+                                       Interval(0, 3, 1)]), 11, 64)
+    assert_executor_reduces_correctly(Work([Interval(-5, 5, 1),
+                                            Interval(-3, 4.5, 0.5)]), 7, LearnedCostModel(16))
+    assert_executor_reduces_correctly(Work([Interval(-5, 5, 1),
+                                            Interval(-3, 4.5, 0.5)]), 7, CallableCostModel(skewed_cost))
+    assert_manager_reduces_correctly(Work([Interval(-5, 5, 1),
+                                           Interval(-3, 4.5, 0.5)]), 7, ("127.0.0.1", 0), LearnedCostModel(16))
+    assert_manager_rejects_materializing_cost_model()
+    assert_listener_keeps_other_files("grid_search_tests.txt")
+
 
 def main():
     run_tests()
@@ -0,0 +1,121 @@
+import struct
+from typing import Iterable, Iterator, List, Tuple
+
+from interval import Interval
+from work import Work
+
+# Intervals are sent as their lattice (origin, step) plus (offset, size), so decoded sub-intervals
+# unfold to exactly the same values as on the sender. Integer intervals are flagged in a bitmask
+# of the header so their values are not turned into floats.
+INTERVAL = struct.Struct("<ddqq")
+WORK_HEADER = struct.Struct("<IQ")
+BATCH_HEADER = struct.Struct("<4sHHIQ")
+LATTICE = struct.Struct("<dd")
+SUB_INTERVAL = struct.Struct("<qq")
+
+BATCH_MAGIC = b"GSWB"
+VERSION = 1
+MAX_DIM = 64
+
+
+def _integer_mask(intervals: List[Interval]) -> int:
+    integer_mask = 0
+    for interval_pos, interval in enumerate(intervals):
+        if isinstance(interval.origin, int) and isinstance(interval.step, int):
+            integer_mask |= 1 << interval_pos
+    return integer_mask
+
+
+def encoded_work_size(work: Work) -> int:
+    return WORK_HEADER.size + work.dim * INTERVAL.size
+
+
+def encode_work_into(work: Work, buffer: bytearray | memoryview, offset: int = 0) -> int:
+    if work.dim > MAX_DIM:
+        raise ValueError(f"Works of more than {MAX_DIM} intervals can not be encoded, got {work.dim}")
+
+    interval_offset = offset + WORK_HEADER.size
+    for interval in work.intervals:
+        INTERVAL.pack_into(buffer, interval_offset, interval.origin, interval.step, interval.offset, interval.size)
+        interval_offset += INTERVAL.size
+
+    WORK_HEADER.pack_into(buffer, offset, work.dim, _integer_mask(work.intervals))
+    return interval_offset
+
+
+def encode_work(work: Work) -> bytes:
+    buffer = bytearray(encoded_work_size(work))
+    encode_work_into(work, buffer)
+    return bytes(buffer)
+
+
+def decode_work_from(buffer: bytes | bytearray | memoryview, offset: int = 0) -> Tuple[Work, int]:
+    view = memoryview(buffer)
+    dim, integer_mask = WORK_HEADER.unpack_from(view, offset)
+    offset += WORK_HEADER.size
+
+    intervals = []
+    for interval_pos, (origin, step, lattice_offset, size) in enumerate(
+            INTERVAL.iter_unpack(view[offset:offset + dim * INTERVAL.size])):
+        if integer_mask >> interval_pos & 1:
+            origin, step = int(origin), int(step)
+        intervals.append(Interval.from_lattice(origin, step, lattice_offset, size))
+    return Work(intervals), offset + dim * INTERVAL.size
+
+
+def decode_work(buffer: bytes | bytearray | memoryview) -> Work:
+    work, _ = decode_work_from(buffer)
+    return work
+
+
+def encode_works(works: Iterable[Work]) -> bytearray:
+    # Works of a batch are sub-works of the same work, so the lattice of each interval is sent
+    # once in the header and every work only adds an (offset, size) pair per interval
+    works = list(works)
+    lattice = works[0].intervals if works else []
+    dim = len(lattice)
+    if dim > MAX_DIM:
+        raise ValueError(f"Works of more than {MAX_DIM} intervals can not be encoded, got {dim}")
+
+    buffer = bytearray(BATCH_HEADER.size + dim * LATTICE.size + len(works) * dim * SUB_INTERVAL.size)
+    BATCH_HEADER.pack_into(buffer, 0, BATCH_MAGIC, VERSION, dim, len(works), _integer_mask(lattice))
+
+    offset = BATCH_HEADER.size
+    for interval in lattice:
+        LATTICE.pack_into(buffer, offset, interval.origin, interval.step)
+        offset += LATTICE.size
+
+    for work in works:
+        if work.dim != dim:
+            raise ValueError(f"Works of a batch must have the same amount of intervals, got {work.dim} and {dim}")
+        for interval, lattice_interval in zip(work.intervals, lattice):
+            if interval.origin != lattice_interval.origin or interval.step != lattice_interval.step:
+                raise ValueError(f"Works of a batch must share their lattice, {work} does not match {works[0]}")
+            SUB_INTERVAL.pack_into(buffer, offset, interval.offset, interval.size)
+            offset += SUB_INTERVAL.size
+    return buffer
+
+
+def iter_decode_works(buffer: bytes | bytearray | memoryview) -> Iterator[Work]:
+    view = memoryview(buffer)
+    magic, version, dim, amount_of_works, integer_mask = BATCH_HEADER.unpack_from(view, 0)
+    if magic != BATCH_MAGIC:
+        raise ValueError(f"Buffer is not a batch of works, magic is {magic!r}")
+    if version != VERSION:
+        raise ValueError(f"Unsupported batch version {version}, expected {VERSION}")
+
+    offset = BATCH_HEADER.size
+    lattice = []
+    for interval_pos, (origin, step) in enumerate(LATTICE.iter_unpack(view[offset:offset + dim * LATTICE.size])):
+        if integer_mask >> interval_pos & 1:
+            origin, step = int(origin), int(step)
+        lattice.append((origin, step))
+    offset += dim * LATTICE.size
+
+    sub_intervals = SUB_INTERVAL.iter_unpack(view[offset:offset + amount_of_works * dim * SUB_INTERVAL.size])
+    for _ in range(amount_of_works):
+        yield Work([Interval.from_lattice(origin, step, *next(sub_intervals)) for origin, step in lattice])
+
+
+def decode_works(buffer: bytes | bytearray | memoryview) -> List[Work]:
+    return list(iter_decode_works(buffer))
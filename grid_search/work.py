@@ -1,9 +1,7 @@
 import math
-from functools import reduce
-from typing import List, Iterator
+from typing import List, Iterator, Tuple
 
 from cartesian_product_calculator import CartesianProductCalculator
-from circular_iterator import CircularIterator
 from interval import Interval
 
 
@@ -16,11 +14,15 @@ class Work:
     def __repr__(self):
         return f"{self._intervals}"
 
-    def __getitem__(self, item):
-        return self._intervals[item]
+    # A work is a sequence of its points, its intervals are in .intervals
+    def __getitem__(self, index: int) -> List[int | float]:
+        return self.point(index)
 
-    def __iter__(self):
-        return iter(self._intervals)
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[List[int | float]]:
+        return self.unfold()
 
     def __calc_size(self) -> int:
         total = 1
@@ -32,80 +34,190 @@ class Work:
     def size(self) -> int:
         return self._size
 
-    def unfold(self, precision: int = None) -> Iterator[List[int | float]]:
-        yield from CartesianProductCalculator.calculate([list(interval.unfold(precision)) for interval in self._intervals])
-
-    @staticmethod
-    def __calc_partitions_amount(partitions_per_interval: List[int]) -> int:
-        return reduce(lambda a, b: a * b, partitions_per_interval)
-
-    def __calc_amount_of_missing_partitions(self, min_batches: int, partitions_per_interval: List[int]) -> int:
-        return math.ceil(min_batches / self.__calc_partitions_amount(partitions_per_interval))
-
-    def __calc_partitions_per_interval(self, min_batches: int) -> List[int]:
-        curr_partitions_per_interval = [1] * self._dim
-
-        for interval_pos in range(self._dim):
-            missing_partitions = self.__calc_amount_of_missing_partitions(min_batches, curr_partitions_per_interval)
-
-            elements = self[interval_pos].size
-            if elements > missing_partitions:
-                curr_partitions_per_interval[interval_pos] *= missing_partitions
-                break
-            else:
-                curr_partitions_per_interval[interval_pos] *= elements
+    @property
+    def dim(self) -> int:
+        return self._dim
 
-        return curr_partitions_per_interval
+    @property
+    def intervals(self) -> List[Interval]:
+        return self._intervals
+
+    def point(self, index: int, precision: int = None) -> List[int | float]:
+        # Flat indices follow the unfold order: the last interval varies fastest
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(f"Work index {index} out of range for size {self._size}")
+
+        point = [0] * self._dim
+        for interval_pos in range(self._dim - 1, -1, -1):
+            interval = self._intervals[interval_pos]
+            index, interval_index = divmod(index, interval.size)
+            point[interval_pos] = interval.value(interval_index, precision)
+        return point
 
-    def split(self, max_chunk_size: int, precision: int = None) -> Iterator["Work"]:
-        min_batches = self.size // max_chunk_size + 1
-        partitions_per_interval = self.__calc_partitions_per_interval(min_batches)
+    def unfold(self, precision: int = None) -> Iterator[List[int | float]]:
+        yield from CartesianProductCalculator.calculate([list(interval.unfold(precision)) for interval in self._intervals])
 
-        lists_of_intervals = []
+    def unfold_with_changes(self, precision: int = None, gray: bool = False) -> Iterator[Tuple[List[int | float], int]]:
+        lists_of_values = [list(interval.unfold(precision)) for interval in self._intervals]
+        if gray:
+            yield from CartesianProductCalculator.calculate_gray(lists_of_values)
+        else:
+            yield from CartesianProductCalculator.calculate_with_changes(lists_of_values)
+
+    def unfold_batches(self, batch_size: int, precision: int = None) -> Iterator["numpy.ndarray"]:
+        # numpy is only required by the batched mode, the rest of the module works without it
+        import numpy
+
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
+
+        origins = numpy.array([interval.origin for interval in self._intervals])
+        offsets = [interval.offset for interval in self._intervals]
+        steps = numpy.array([interval.step for interval in self._intervals])
+        sizes = [interval.size for interval in self._intervals]
+        dtype = numpy.result_type(origins, steps)
+
+        for batch_start in range(0, self._size, batch_size):
+            flat_indices = numpy.arange(batch_start, min(batch_start + batch_size, self._size), dtype=numpy.int64)
+            batch = numpy.empty((len(flat_indices), self._dim), dtype=dtype)
+            for interval_pos in range(self._dim - 1, -1, -1):
+                flat_indices, interval_indices = numpy.divmod(flat_indices, sizes[interval_pos])
+                interval_indices += offsets[interval_pos]
+                numpy.multiply(interval_indices, steps[interval_pos], out=batch[:, interval_pos], casting="unsafe")
+                batch[:, interval_pos] += origins[interval_pos]
+            if precision is not None:
+                _round_like_python(batch, precision)
+            yield batch
+
+    def plan(self, max_chunk_size: int) -> "WorkPlan":
+        return WorkPlan(self, max_chunk_size)
+
+    def split(self, max_chunk_size: int) -> Iterator["Work"]:
+        yield from self.plan(max_chunk_size)
+
+
+def _round_like_python(batch: "numpy.ndarray", precision: int):
+    # numpy.round scales, rounds and scales back, which only differs from the correctly rounded
+    # round() of unfold when the scaled value is within a few ulps of a tie, e.g. 2.675 rounds to
+    # 2.68 instead of 2.67. Those values, or all of them when the scale is not exact, use round().
+    import numpy
+    if not numpy.issubdtype(batch.dtype, numpy.floating):
+        return
+    if 0 <= precision <= 22:
+        scaled = batch * 10.0 ** precision
+        distance_to_tie = numpy.abs(numpy.abs(scaled - numpy.trunc(scaled)) - 0.5)
+        near_tie = numpy.nonzero(distance_to_tie <= 4 * numpy.spacing(numpy.abs(scaled)))
+    else:
+        near_tie = numpy.nonzero(numpy.ones(batch.shape, dtype=bool))
+    values = [round(float(value), precision) for value in batch[near_tie]]
+    numpy.round(batch, precision, out=batch)
+    batch[near_tie] = values
 
-        for interval_pos in range(self._dim):
-            iterator = self[interval_pos].split(partitions_per_interval[interval_pos],
-                                                precision)
-            iterator = CircularIterator(iterator, partitions_per_interval[interval_pos])
-            lists_of_intervals.append(iterator)
 
-        yield from WorkPlan(lists_of_intervals, partitions_per_interval)
+class WorkPlan:
+    # Chunks keep the trailing intervals that fit whole, split the next one (the pivot) into even
+    # blocks and fix the leading ones to a single value. Each chunk is then a contiguous range of
+    # flat indices of the work, and chunk N is built in O(dim) without generating the others.
+    def __init__(self, work: Work, max_chunk_size: int):
+        if max_chunk_size < 1:
+            raise ValueError(f"max_chunk_size must be positive, got {max_chunk_size}")
+
+        self._work = work
+
+        intervals = work.intervals
+        pivot_pos = len(intervals) - 1
+        points_after_pivot = 1
+        while pivot_pos >= 0 and points_after_pivot * intervals[pivot_pos].size <= max_chunk_size:
+            points_after_pivot *= intervals[pivot_pos].size
+            pivot_pos -= 1
+
+        self._pivot_pos = pivot_pos
+        self._points_after_pivot = points_after_pivot
+
+        if work.size == 0:
+            self._blocks_per_pivot = 1
+            self._amount_of_chunks = 0
+            return
+
+        if pivot_pos < 0:
+            self._blocks_per_pivot = 1
+            self._amount_of_chunks = 1
+            return
+
+        pivot_size = intervals[pivot_pos].size
+        max_elems_per_block = max_chunk_size // points_after_pivot
+        self._blocks_per_pivot = math.ceil(pivot_size / max_elems_per_block)
+        self._amount_of_chunks = work.size // (pivot_size * points_after_pivot) * self._blocks_per_pivot
+
+    def __len__(self) -> int:
+        return self._amount_of_chunks
+
+    def __getitem__(self, chunk_index: int) -> Work:
+        chunk_index = self.__normalize_index(chunk_index)
+        if self._pivot_pos < 0:
+            return self._work
+
+        intervals = self._work.intervals
+        prefix_index, block = divmod(chunk_index, self._blocks_per_pivot)
+
+        sub_intervals = list(intervals)
+        for interval_pos in range(self._pivot_pos - 1, -1, -1):
+            prefix_index, interval_index = divmod(prefix_index, intervals[interval_pos].size)
+            sub_intervals[interval_pos] = intervals[interval_pos].sub_interval(interval_index, interval_index + 1)
+
+        block_start, block_end = self.__block_bounds(block)
+        sub_intervals[self._pivot_pos] = intervals[self._pivot_pos].sub_interval(block_start, block_end)
+        return Work(sub_intervals)
+
+    def __iter__(self) -> Iterator[Work]:
+        for chunk_index in range(self._amount_of_chunks):
+            yield self[chunk_index]
+
+    def __normalize_index(self, chunk_index: int) -> int:
+        if chunk_index < 0:
+            chunk_index += self._amount_of_chunks
+        if not 0 <= chunk_index < self._amount_of_chunks:
+            raise IndexError(f"Chunk index {chunk_index} out of range for {self._amount_of_chunks} chunks")
+        return chunk_index
+
+    def __block_bounds(self, block: int) -> Tuple[int, int]:
+        pivot_size = self._work.intervals[self._pivot_pos].size
+        return block * pivot_size // self._blocks_per_pivot, (block + 1) * pivot_size // self._blocks_per_pivot
 
+    @property
+    def work(self) -> Work:
+        return self._work
 
-class WorkPlan:
-    def __init__(self, intervals: List[CircularIterator], intervals_per_iterator: List[int]):
-        self._intervals = intervals
-        self._intervals_per_iterator = intervals_per_iterator
-
-    def calc_cartesian_product(self) -> Iterator["Work"]:
-        positions = [0 for _ in self._intervals]
-        prev_positions = [0 for _ in self._intervals]
-        current_values = [next(iterator) for iterator in self._intervals]
-
-        for value in self._intervals:
-            if not value:
-                return
-
-        while True:
-            yield Work([current_value for current_value in current_values])
-
-            for i in range(len(self._intervals)):
-                positions[i] += 1
-                if positions[i] < self._intervals_per_iterator[i]:
-                    break
-                positions[i] = 0
-                if i == len(self._intervals) - 1:
-                    return
-
-            for i in range(len(self._intervals)):
-                if positions[i] != prev_positions[i]:
-                    current_values[i] = next(self._intervals[i])
-                    prev_positions[i] = positions[i]
-                else:
-                    break
-
-    def __iter__(self) -> Iterator["Work"]:
-        yield from self.calc_cartesian_product()
+    @property
+    def amount_of_chunks(self) -> int:
+        return self._amount_of_chunks
+
+    def index_range(self, chunk_index: int) -> Tuple[int, int]:
+        chunk_index = self.__normalize_index(chunk_index)
+        if self._pivot_pos < 0:
+            return 0, self._work.size
+
+        prefix_index, block = divmod(chunk_index, self._blocks_per_pivot)
+        pivot_size = self._work.intervals[self._pivot_pos].size
+        offset = prefix_index * pivot_size * self._points_after_pivot
+        block_start, block_end = self.__block_bounds(block)
+        return offset + block_start * self._points_after_pivot, offset + block_end * self._points_after_pivot
+
+    def chunk_at(self, index: int) -> int:
+        # Inverse of index_range: the chunk holding the point with this flat index
+        if not 0 <= index < self._work.size:
+            raise IndexError(f"Point index {index} out of range for {self._work.size} points")
+        if self._pivot_pos < 0:
+            return 0
+
+        pivot_size = self._work.intervals[self._pivot_pos].size
+        prefix_index, pivot_offset = divmod(index, pivot_size * self._points_after_pivot)
+        element = pivot_offset // self._points_after_pivot
+        # Largest block whose start, block * pivot_size // blocks_per_pivot, is not after the element
+        block = ((element + 1) * self._blocks_per_pivot - 1) // pivot_size
+        return prefix_index * self._blocks_per_pivot + block
 
     def unfold(self, precision: int = None) -> List[List[int]]:
         result = []
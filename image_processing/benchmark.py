@@ -0,0 +1,205 @@
+'''
+Benchmark of the image multiplicator on a synthetic corpus.
+
+A corpus of random images of the given count, resolution and format is generated first.
+The single-decode mode is then run with its stage timer to time the read, decode, transform,
+encode and write stages separately, and every mode of the multiplicator is run end to end in
+its own process to compare images per second and memory. Memory is the peak of the summed
+RSS of the process and its children, sampled from /proc, next to the largest RSS of any
+single process. Results are printed and written as JSON.
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from PIL import Image
+
+import image_multiplicator
+
+FORMATS = {'jpeg': '.jpeg', 'png': '.png', 'bmp': '.bmp'}
+MODES = ['single_decode', 'parallel', 'two_pass']
+
+
+def synthetic_image(rng, width, height):
+    # Noise over a gradient, smoother than pure noise so the encoders behave as on photos
+    noise = Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+    gradient = Image.linear_gradient('L').resize((width, height)).rotate(rng.uniform(0, 360)).convert('RGB')
+    return Image.blend(noise, gradient, 0.75)
+
+
+def generate_corpus(folder, count, width, height, image_format, seed=0):
+    rng = random.Random(seed)
+    image_multiplicator.create_folders(folder)
+    for image_index in range(count):
+        synthetic_image(rng, width, height).save(f'{folder}/image_{image_index}{FORMATS[image_format]}')
+
+
+def max_process_rss():
+    # Largest RSS of this process or any of its waited-for children, not their sum.
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+
+def process_tree_rss(pid):
+    # Summed RSS of a process and all its descendants, read from /proc. Pages shared between
+    # forked processes are counted once per process, so this is an upper bound.
+    parents = {}
+    rss_pages = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Fields after the parenthesised command name, which may hold spaces: state, ppid, ..., rss
+        fields = stat[stat.rindex(')') + 2:].split()
+        parents[int(entry)] = int(fields[1])
+        rss_pages[int(entry)] = int(fields[21])
+
+    tree = {pid}
+    pending = [pid]
+    while pending:
+        parent = pending.pop()
+        for child, child_parent in parents.items():
+            if child_parent == parent and child not in tree:
+                tree.add(child)
+                pending.append(child)
+    return sum(rss_pages.get(process, 0) for process in tree) * os.sysconf('SC_PAGE_SIZE')
+
+
+def peak_tree_rss(process, interval=0.05):
+    # Polled until the process exits, peaks shorter than the interval may be missed
+    if not os.path.isdir('/proc'):
+        process.join()
+        return None
+    peak = 0
+    while process.is_alive():
+        peak = max(peak, process_tree_rss(process.pid))
+        time.sleep(interval)
+    process.join()
+    return peak
+
+
+def stage_times(input_folder, output_folder):
+    timer = image_multiplicator.StageTimer()
+    image_multiplicator.single_decode(input_folder, output_folder, timer=timer)
+    total = sum(timer.seconds.values())
+    return {
+        'images': timer.images,
+        'outputs': timer.outputs,
+        'seconds': timer.seconds,
+        'share': {stage: stage_time / total if total else 0.0 for stage, stage_time in timer.seconds.items()},
+    }
+
+
+def _run_mode(mode, input_folder, output_folder, workers, results):
+    start_time = time.perf_counter()
+    if mode == 'two_pass':
+        image_multiplicator.two_pass(input_folder, f'{output_folder}_intermediate', output_folder)
+    elif mode == 'parallel':
+        image_multiplicator.parallel(input_folder, output_folder, workers=workers)
+    else:
+        image_multiplicator.single_decode(input_folder, output_folder)
+    results.put((time.perf_counter() - start_time, max_process_rss()))
+
+
+def run_mode(mode, input_folder, output_folder, workers=None):
+    # Every mode runs in a fresh process, so its memory is not the peak of a previous mode
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_mode, args=(mode, input_folder, output_folder, workers, results))
+    process.start()
+    tree_rss = peak_tree_rss(process)
+    if process.exitcode != 0:
+        raise RuntimeError(f'Mode {mode} failed with exit code {process.exitcode}')
+    elapsed, process_rss = results.get()
+
+    images = len(os.listdir(input_folder))
+    return {
+        'mode': mode,
+        'seconds': elapsed,
+        'images_per_second': images / elapsed,
+        'outputs_per_second': images * len(image_multiplicator.FLIPS) * len(image_multiplicator.ROTATIONS) / elapsed,
+        'peak_tree_rss_bytes': tree_rss,
+        'max_process_rss_bytes': process_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count',
+                        default=100,
+                        help='Amount of images of the synthetic corpus. Default is 100',
+                        type=int)
+    parser.add_argument('--width',
+                        default=1920,
+                        help='Width of the synthetic images. Default is 1920',
+                        type=int)
+    parser.add_argument('--height',
+                        default=1080,
+                        help='Height of the synthetic images. Default is 1080',
+                        type=int)
+    parser.add_argument('-f', '--format',
+                        default='jpeg',
+                        choices=list(FORMATS),
+                        help='Format of the synthetic images. Default is jpeg')
+    parser.add_argument('--modes',
+                        default=MODES,
+                        nargs='+',
+                        choices=MODES,
+                        help=f'Modes of the multiplicator to compare. Default is {" ".join(MODES)}')
+    parser.add_argument('-w', '--workers',
+                        default=None,
+                        help='Amount of worker processes of the parallel mode. Default is the amount of CPUs',
+                        type=int)
+    parser.add_argument('--seed',
+                        default=0,
+                        help='Random seed of the synthetic corpus. Default is 0',
+                        type=int)
+    parser.add_argument('-o', '--output',
+                        default='benchmark_results.json',
+                        help='Path where the JSON results are written. Default is benchmark_results.json',
+                        type=str)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as folder:
+        corpus_folder = f'{folder}/input'
+        start_time = time.perf_counter()
+        generate_corpus(corpus_folder, args.count, args.width, args.height, args.format, args.seed)
+        print(f'Generated {args.count} {args.width}x{args.height} {args.format} images '
+              f'in {time.perf_counter() - start_time:.2f} s')
+
+        stages = stage_times(corpus_folder, f'{folder}/stages')
+        for stage, stage_time in stages['seconds'].items():
+            print(f'{stage:<10} {stage_time:>10.3f} s {stages["share"][stage]:>7.1%}')
+
+        modes = []
+        for mode in args.modes:
+            modes.append(run_mode(mode, corpus_folder, f'{folder}/{mode}', args.workers))
+            tree_rss = modes[-1]['peak_tree_rss_bytes']
+            print(f'{mode:<15} {modes[-1]["seconds"]:>10.3f} s {modes[-1]["images_per_second"]:>10.2f} images/s '
+                  f'{f"{tree_rss / 2 ** 20:.1f}" if tree_rss is not None else "n/a":>10} MiB peak tree RSS '
+                  f'{modes[-1]["max_process_rss_bytes"] / 2 ** 20:>10.1f} MiB max process RSS')
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': {'count': args.count, 'width': args.width, 'height': args.height, 'format': args.format},
+            'stages': stages,
+            'modes': modes,
+        }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,50 +9,415 @@ Then, from the images in folder_2 it saves the following in folder_3:
 - The image rotated 90 degrees
 - The image rotated 180 degrees
 - The image rotated 270 degrees
+
+In the default single-decode mode every input is decoded once and the 12 images of folder_3
+are produced from memory, folder_2 is only written when asked for. The two-pass mode keeps
+the original flow of saving folder_2 and decoding it again. The parallel mode runs the
+single-decode pipeline with files read and written by threads and images decoded, transformed
+and encoded by a pool of processes. With --incremental only the inputs that changed since the
+last run are processed, as recorded in a manifest of their sizes, modification times,
+content hashes and outputs.
 '''
+import argparse
+import hashlib
+import io
+import json
 import os
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
 from PIL import Image
 import time
 from tqdm import tqdm
 
-folder_1 = 'input'
-folder_2 = 'folder_2'
-folder_3 = 'folder_3'
-
-start_time = time.time()
-
-# Create folder_2 and folder_3 if they don't exist
-if not os.path.exists(folder_2):
-    os.makedirs(folder_2)
-if not os.path.exists(folder_3):
-    os.makedirs(folder_3)
-    
-# Flip images in folder_1
-file_list = os.listdir(folder_1)
-for filename in tqdm(file_list, desc="Processing images", unit="image"):
-    img = Image.open(f'{folder_1}/{filename}')
+FLIPS = [
+    ('flip_0', None),
+    ('flip_h', Image.FLIP_LEFT_RIGHT),
+    ('flip_v', Image.FLIP_TOP_BOTTOM),
+]
+ROTATIONS = [
+    ('rotate_0', None),
+    ('rotate_90', Image.ROTATE_90),
+    ('rotate_180', Image.ROTATE_180),
+    ('rotate_270', Image.ROTATE_270),
+]
+STAGES = ['read', 'decode', 'transform', 'encode', 'write']
+
+
+class StageTimer:
+    # Seconds spent in every stage of the single-decode pipeline, summed over the images
+    def __init__(self):
+        self.seconds = {stage: 0.0 for stage in STAGES}
+        self.images = 0
+        self.outputs = 0
+
+    @contextmanager
+    def stage(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start_time
+
+    def iterate(self, name, iterable):
+        # Times the production of every item, e.g. the transposes of a generator of variants
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, None)
+            if item is None:
+                return
+            yield item
+
+
+def transpose(img, method):
+    return img if method is None else img.transpose(method)
+
+
+def decode_bytes(data):
+    img = Image.open(io.BytesIO(data))
+    # Decoding is lazy in PIL, it is forced here so it is not repeated by every transform
+    img.load()
+    return img
+
+
+def flips(img):
+    return [(flip_name, transpose(img, method)) for flip_name, method in FLIPS]
+
+
+def rotations(img):
+    return [(rotation_name, transpose(img, method)) for rotation_name, method in ROTATIONS]
+
+
+def variants(img):
+    # The 12 images of folder_3, named as in the two-pass flow: <name>_flip_h_rotate_90<ext>
+    for flip_name, flipped in flips(img):
+        for rotation_name, rotated in rotations(flipped):
+            yield f'{flip_name}_{rotation_name}', rotated
+
+
+def encode(img, extension):
+    # Same format PIL would pick when saving to a file with this extension
+    buffer = io.BytesIO()
+    img.save(buffer, format=Image.registered_extensions()[extension.lower()])
+    return buffer.getvalue()
+
+
+def multiply_encoded(filename, data, write_intermediate=False):
+    # Decode, transform and encode stages of the parallel mode, run in a worker process.
+    # Returns the (folder, filename, bytes) of every output, folder being output or intermediate.
+    img = decode_bytes(data)
+    raw_filename, extension = os.path.splitext(filename)
+
+    outputs = []
+    if write_intermediate:
+        for flip_name, flipped in flips(img):
+            outputs.append(('intermediate', f'{raw_filename}_{flip_name}{extension}', encode(flipped, extension)))
+    for variant_name, variant in variants(img):
+        outputs.append(('output', f'{raw_filename}_{variant_name}{extension}', encode(variant, extension)))
+    return outputs
+
+
+def create_folders(*folders):
+    for folder in folders:
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+
+def _output_images(img, raw_filename, extension, output_folder, intermediate_folder=None):
+    if intermediate_folder is not None:
+        for flip_name, flipped in flips(img):
+            yield f'{intermediate_folder}/{raw_filename}_{flip_name}{extension}', flipped
+    for variant_name, variant in variants(img):
+        yield f'{output_folder}/{raw_filename}_{variant_name}{extension}', variant
+
+
+def multiply_image(filename, input_folder, output_folder, intermediate_folder=None, timer=None):
+    # Every output is encoded in memory and then written, so the stages can be timed apart
+    timer = timer or StageTimer()
+    with timer.stage('read'):
+        with open(f'{input_folder}/{filename}', 'rb') as f:
+            data = f.read()
+    with timer.stage('decode'):
+        img = decode_bytes(data)
     raw_filename, extension = os.path.splitext(filename)
-    
-    flip_h = img.transpose(Image.FLIP_LEFT_RIGHT)
-    flip_v = img.transpose(Image.FLIP_TOP_BOTTOM)
-    
-    img.save(f'{folder_2}/{raw_filename}_flip_0{extension}')
-    flip_h.save(f'{folder_2}/{raw_filename}_flip_h{extension}')
-    flip_v.save(f'{folder_2}/{raw_filename}_flip_v{extension}')
-
-# Rotate images in folder_2
-file_list = os.listdir(folder_2)
-for filename in tqdm(file_list, desc="Processing images", unit="image"):
-    img = Image.open(f'{folder_2}/{filename}')
+
+    for path, output_img in timer.iterate('transform', _output_images(img, raw_filename, extension, output_folder,
+                                                                       intermediate_folder)):
+        with timer.stage('encode'):
+            output_data = encode(output_img, extension)
+        with timer.stage('write'):
+            with open(path, 'wb') as f:
+                f.write(output_data)
+        timer.outputs += 1
+    timer.images += 1
+
+
+def single_decode(input_folder, output_folder, intermediate_folder=None, file_list=None, timer=None):
+    create_folders(output_folder, *([intermediate_folder] if intermediate_folder is not None else []))
+    file_list = os.listdir(input_folder) if file_list is None else file_list
+    for filename in tqdm(file_list, desc="Processing images", unit="image"):
+        multiply_image(filename, input_folder, output_folder, intermediate_folder, timer)
+
+
+def _put(work_queue, item, stop):
+    # Gives up once the run is stopped, the stage on the other side may not be there anymore
+    while not stop.is_set():
+        try:
+            work_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(work_queue, stop):
+    while not stop.is_set():
+        try:
+            return work_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def _read_files(input_folder, file_list, read_queue, stop):
+    try:
+        for filename in file_list:
+            with open(f'{input_folder}/{filename}', 'rb') as f:
+                if not _put(read_queue, (filename, f.read()), stop):
+                    return
+        _put(read_queue, None, stop)
+    except Exception as error:
+        # Raised again by the main thread, so a failed read is not taken for the end of the inputs
+        _put(read_queue, error, stop)
+
+
+def _write_files(folders, write_queue, progress, stop, errors):
+    try:
+        while (outputs := _get(write_queue, stop)) is not None:
+            for folder, filename, data in outputs:
+                with open(f'{folders[folder]}/{filename}', 'wb') as f:
+                    f.write(data)
+            progress.update()
+    except Exception as error:
+        # Stops the reader and the main thread, which raises the error once the pool is done
+        errors.append(error)
+        stop.set()
+
+
+def parallel(input_folder, output_folder, intermediate_folder=None, workers=None, queue_size=None, file_list=None):
+    # Reading, CPU work and writing overlap: a thread reads the inputs, the process pool decodes,
+    # transforms and encodes them, and a thread writes the outputs. Queues and the amount of
+    # images in the pool are bounded, so memory does not grow with the size of the input folder.
+    # An error in any stage stops the others and is raised here.
+    create_folders(output_folder, *([intermediate_folder] if intermediate_folder is not None else []))
+    folders = {'output': output_folder, 'intermediate': intermediate_folder}
+    file_list = os.listdir(input_folder) if file_list is None else file_list
+    workers = workers or os.cpu_count()
+    queue_size = queue_size or 2 * workers
+
+    read_queue = queue.Queue(queue_size)
+    write_queue = queue.Queue(queue_size)
+    stop = threading.Event()
+    write_errors = []
+    with tqdm(total=len(file_list), desc="Processing images", unit="image") as progress:
+        reader = threading.Thread(target=_read_files, args=(input_folder, file_list, read_queue, stop), daemon=True)
+        writer = threading.Thread(target=_write_files, args=(folders, write_queue, progress, stop, write_errors),
+                                  daemon=True)
+        reader.start()
+        writer.start()
+
+        try:
+            with ProcessPoolExecutor(workers) as pool:
+                in_flight = set()
+                while (item := _get(read_queue, stop)) is not None:
+                    if isinstance(item, Exception):
+                        raise item
+                    if len(in_flight) >= queue_size:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            _put(write_queue, future.result(), stop)
+                    filename, data = item
+                    in_flight.add(pool.submit(multiply_encoded, filename, data, intermediate_folder is not None))
+                for future in in_flight:
+                    _put(write_queue, future.result(), stop)
+
+            _put(write_queue, None, stop)
+            writer.join()
+        finally:
+            stop.set()
+    if write_errors:
+        raise write_errors[0]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(2 ** 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def output_paths(filename, output_folder, intermediate_folder=None):
+    # Output names only depend on the input name, so the outputs of an input are known without processing it
     raw_filename, extension = os.path.splitext(filename)
-    
-    rotate_90 = img.transpose(Image.ROTATE_90)
-    rotate_180 = img.transpose(Image.ROTATE_180)
-    rotate_270 = img.transpose(Image.ROTATE_270)
-    
-    img.save(f'{folder_3}/{raw_filename}_rotate_0{extension}')
-    rotate_90.save(f'{folder_3}/{raw_filename}_rotate_90{extension}')
-    rotate_180.save(f'{folder_3}/{raw_filename}_rotate_180{extension}')
-    rotate_270.save(f'{folder_3}/{raw_filename}_rotate_270{extension}')
-    
-print(f'--- {time.time() - start_time} seconds ---')
\ No newline at end of file
+    paths = []
+    if intermediate_folder is not None:
+        paths.extend(f'{intermediate_folder}/{raw_filename}_{flip_name}{extension}' for flip_name, _ in FLIPS)
+    paths.extend(f'{output_folder}/{raw_filename}_{flip_name}_{rotation_name}{extension}'
+                 for flip_name, _ in FLIPS for rotation_name, _ in ROTATIONS)
+    return paths
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    # Written to a temporary file first so an interrupted run never leaves a corrupt manifest
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def default_manifest_path(output_folder):
+    # Next to the output folder rather than in it, so the folder only holds generated images
+    return f'{os.path.normpath(output_folder)}.manifest.json'
+
+
+def incremental(run, input_folder, output_folder, intermediate_folder=None, manifest_path=None):
+    # An input is processed again when its content, the parameters or any of its outputs changed.
+    # Outputs of removed inputs, or no longer produced by the current parameters, are deleted.
+    # Only inputs whose size or modification time changed are read and hashed again. Output
+    # paths are kept absolute, so spelling a folder differently does not make its images stale.
+    manifest_path = manifest_path or default_manifest_path(output_folder)
+    manifest = load_manifest(manifest_path)
+    parameters = {
+        'variants': [f'{flip_name}_{rotation_name}' for flip_name, _ in FLIPS for rotation_name, _ in ROTATIONS],
+        'write_intermediate': intermediate_folder is not None,
+    }
+
+    entries = {}
+    hashed = 0
+    for filename in sorted(os.listdir(input_folder)):
+        outputs = [os.path.abspath(path) for path in output_paths(filename, output_folder, intermediate_folder)]
+        stat = os.stat(f'{input_folder}/{filename}')
+        previous = manifest.get(filename)
+        if previous is not None and previous.get('size') == stat.st_size \
+                and previous.get('mtime_ns') == stat.st_mtime_ns:
+            content_hash = previous['hash']
+        else:
+            content_hash = file_hash(f'{input_folder}/{filename}')
+            hashed += 1
+        entries[filename] = {'hash': content_hash, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                             'parameters': parameters, 'outputs': outputs}
+
+    produced = {path for entry in entries.values() for path in entry['outputs']}
+    stale = {os.path.abspath(path) for entry in manifest.values() for path in entry['outputs']}
+    stale = sorted(path for path in stale if path not in produced and os.path.exists(path))
+    for path in stale:
+        os.remove(path)
+
+    # Decided once the stale outputs are gone, so any output removed by mistake is produced again
+    changed = []
+    for filename, entry in entries.items():
+        previous = manifest.get(filename)
+        if previous is None or previous['hash'] != entry['hash'] or previous['parameters'] != parameters \
+                or not all(os.path.exists(path) for path in entry['outputs']):
+            changed.append(filename)
+
+    print(f'{len(changed)} of {len(entries)} images changed ({hashed} hashed), {len(stale)} stale outputs removed')
+    if changed:
+        run(changed)
+    save_manifest(manifest_path, entries)
+
+
+def two_pass(input_folder, intermediate_folder, output_folder):
+    create_folders(intermediate_folder, output_folder)
+
+    # Flip images in folder_1
+    file_list = os.listdir(input_folder)
+    for filename in tqdm(file_list, desc="Processing images", unit="image"):
+        img = Image.open(f'{input_folder}/{filename}')
+        raw_filename, extension = os.path.splitext(filename)
+        for flip_name, flipped in flips(img):
+            flipped.save(f'{intermediate_folder}/{raw_filename}_{flip_name}{extension}')
+
+    # Rotate images in folder_2
+    file_list = os.listdir(intermediate_folder)
+    for filename in tqdm(file_list, desc="Processing images", unit="image"):
+        img = Image.open(f'{intermediate_folder}/{filename}')
+        raw_filename, extension = os.path.splitext(filename)
+        for rotation_name, rotated in rotations(img):
+            rotated.save(f'{output_folder}/{raw_filename}_{rotation_name}{extension}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input',
+                        default='input',
+                        help='Folder with the images to multiply. Default is input',
+                        type=str)
+    parser.add_argument('--intermediate',
+                        default='folder_2',
+                        help='Folder of the flipped images. Default is folder_2',
+                        type=str)
+    parser.add_argument('-o', '--output',
+                        default='folder_3',
+                        help='Folder of the flipped and rotated images. Default is folder_3',
+                        type=str)
+    parser.add_argument('-m', '--mode',
+                        default='single_decode',
+                        choices=['single_decode', 'parallel', 'two_pass'],
+                        help='single_decode decodes every input once and produces all the outputs from memory, '
+                             'parallel does the same on a pool of processes, '
+                             'two_pass saves the flipped images and decodes them again. Default is single_decode')
+    parser.add_argument('--write_intermediate',
+                        action='store_true',
+                        help='Also save the flipped images in the single_decode and parallel modes')
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help='Only process the images that changed since the last run and remove stale outputs, '
+                             'in the single_decode and parallel modes')
+    parser.add_argument('--manifest',
+                        default=None,
+                        help='Manifest of the incremental mode. Default is <output>.manifest.json next to the output folder',
+                        type=str)
+    parser.add_argument('-w', '--workers',
+                        default=None,
+                        help='Amount of worker processes of the parallel mode. Default is the amount of CPUs',
+                        type=int)
+    parser.add_argument('-q', '--queue_size',
+                        default=None,
+                        help='Maximum amount of images waiting between the stages of the parallel mode. '
+                             'Default is twice the amount of workers',
+                        type=int)
+
+    args = parser.parse_args()
+    start_time = time.time()
+    intermediate_folder = args.intermediate if args.write_intermediate else None
+    if args.incremental and args.mode == 'two_pass':
+        parser.error('--incremental is not supported in the two_pass mode')
+
+    def run(file_list=None):
+        if args.mode == 'two_pass':
+            two_pass(args.input, args.intermediate, args.output)
+        elif args.mode == 'parallel':
+            parallel(args.input, args.output, intermediate_folder, args.workers, args.queue_size, file_list)
+        else:
+            single_decode(args.input, args.output, intermediate_folder, file_list)
+
+    if args.incremental:
+        incremental(run, args.input, args.output, intermediate_folder, args.manifest)
+    else:
+        run()
+    print(f'--- {time.time() - start_time} seconds ---')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import os
+import tempfile
+import threading
+from PIL import Image, UnidentifiedImageError
+
+import image_multiplicator
+
+
+def save_image(path, color, size=(8, 6)):
+    Image.new('RGB', size, color).save(path)
+
+
+def output_mtimes(folder):
+    return {filename: os.stat(f'{folder}/{filename}').st_mtime_ns for filename in os.listdir(folder)}
+
+
+def assert_incremental_runs_rebuild_changes_only():
+    with tempfile.TemporaryDirectory() as folder:
+        input_folder = f'{folder}/input'
+        output_folder = f'{folder}/output'
+        image_multiplicator.create_folders(input_folder, output_folder)
+        for name, color in [('kept', 'red'), ('changed', 'green'), ('removed', 'blue')]:
+            save_image(f'{input_folder}/{name}.png', color)
+
+        processed = []
+        hashed = []
+        file_hash = image_multiplicator.file_hash
+
+        def run(file_list):
+            processed.append(sorted(file_list))
+            image_multiplicator.single_decode(input_folder, output_folder, file_list=file_list)
+
+        def incremental():
+            processed.clear()
+            hashed.clear()
+            image_multiplicator.incremental(run, input_folder, output_folder)
+
+        def counting_file_hash(path):
+            hashed.append(os.path.basename(path))
+            return file_hash(path)
+
+        image_multiplicator.file_hash = counting_file_hash
+        try:
+            incremental()
+            if processed != [['changed.png', 'kept.png', 'removed.png']]:
+                raise AssertionError(f'First run processed {processed}')
+            variants = len(image_multiplicator.FLIPS) * len(image_multiplicator.ROTATIONS)
+            if len(output_mtimes(output_folder)) != 3 * variants:
+                raise AssertionError(f'First run wrote {len(output_mtimes(output_folder))} outputs')
+
+            # Nothing changed: nothing is processed and no input is read again
+            incremental()
+            if processed or hashed:
+                raise AssertionError(f'Unchanged run processed {processed} and hashed {hashed}')
+
+            kept_outputs = {filename: mtime for filename, mtime in output_mtimes(output_folder).items()
+                            if filename.startswith('kept_')}
+            save_image(f'{input_folder}/changed.png', 'white', size=(6, 8))
+            save_image(f'{input_folder}/added.png', 'black')
+            os.remove(f'{input_folder}/removed.png')
+            incremental()
+            if processed != [['added.png', 'changed.png']] or sorted(hashed) != ['added.png', 'changed.png']:
+                raise AssertionError(f'Run after changes processed {processed} and hashed {hashed}')
+
+            outputs = output_mtimes(output_folder)
+            if any(filename.startswith('removed_') for filename in outputs):
+                raise AssertionError('Outputs of the removed input were not deleted')
+            if len(outputs) != 3 * variants:
+                raise AssertionError(f'Run after changes left {len(outputs)} outputs, expected {3 * variants}')
+            if any(outputs[filename] != mtime for filename, mtime in kept_outputs.items()):
+                raise AssertionError('Outputs of the unchanged input were written again')
+            with Image.open(f'{output_folder}/changed_flip_0_rotate_0.png') as img:
+                if img.size != (6, 8):
+                    raise AssertionError(f'Output of the changed input has size {img.size}')
+
+            # A touched input is hashed again but, its content being the same, not processed
+            os.utime(f'{input_folder}/kept.png')
+            incremental()
+            if processed or hashed != ['kept.png']:
+                raise AssertionError(f'Run after a touch processed {processed} and hashed {hashed}')
+        finally:
+            image_multiplicator.file_hash = file_hash
+    print('Incremental runs rebuild changes only')
+
+
+def assert_incremental_runs_accept_other_spellings():
+    with tempfile.TemporaryDirectory() as folder:
+        input_folder = f'{folder}/input'
+        image_multiplicator.create_folders(input_folder)
+        for name, color in [('first', 'red'), ('second', 'green')]:
+            save_image(f'{input_folder}/{name}.png', color)
+
+        processed = []
+
+        def run(output_folder):
+            def run_files(file_list):
+                processed.extend(file_list)
+                image_multiplicator.single_decode(input_folder, output_folder, file_list=file_list)
+            return run_files
+
+        image_multiplicator.incremental(run(f'{folder}/output'), input_folder, f'{folder}/output')
+        outputs = output_mtimes(f'{folder}/output')
+        for output_folder in [f'{folder}/output/', f'{folder}/./output', f'{folder}/input/../output']:
+            processed.clear()
+            image_multiplicator.incremental(run(output_folder), input_folder, output_folder)
+            if processed or output_mtimes(f'{folder}/output') != outputs:
+                raise AssertionError(f'Run with {output_folder} processed {processed} and left '
+                                     f'{len(output_mtimes(f"{folder}/output"))} of {len(outputs)} outputs')
+        if not os.path.exists(f'{folder}/output.manifest.json'):
+            raise AssertionError('Manifest was not written next to the output folder')
+    print('Incremental runs accept other spellings')
+
+
+def folder_contents(folder):
+    contents = {}
+    for filename in os.listdir(folder):
+        with open(f'{folder}/{filename}', 'rb') as f:
+            contents[filename] = f.read()
+    return contents
+
+
+def run_parallel(*args, **kwargs):
+    # Runs the parallel mode in a thread, so a stage waiting forever fails the test instead of hanging it
+    errors = []
+
+    def run():
+        try:
+            image_multiplicator.parallel(*args, **kwargs)
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    if thread.is_alive():
+        raise AssertionError(f'Parallel mode did not finish with {args} and {kwargs}')
+    if errors:
+        raise errors[0]
+
+
+def assert_parallel_mode_matches_single_decode():
+    with tempfile.TemporaryDirectory() as folder:
+        input_folder = f'{folder}/input'
+        image_multiplicator.create_folders(input_folder)
+        for name, color, extension in [('red', 'red', 'png'), ('green', 'green', 'jpg'), ('blue', 'blue', 'png'),
+                                       ('wide', 'white', 'jpg'), ('tall', 'black', 'png')]:
+            save_image(f'{input_folder}/{name}.{extension}', color,
+                       size={'wide': (16, 3), 'tall': (3, 16)}.get(name, (8, 6)))
+
+        image_multiplicator.single_decode(input_folder, f'{folder}/single', f'{folder}/single_intermediate')
+        # A queue smaller than the amount of images keeps every stage waiting on the others
+        run_parallel(input_folder, f'{folder}/parallel', f'{folder}/parallel_intermediate', workers=2, queue_size=1)
+        for single, parallel in [('single', 'parallel'), ('single_intermediate', 'parallel_intermediate')]:
+            expected = folder_contents(f'{folder}/{single}')
+            if not expected or folder_contents(f'{folder}/{parallel}') != expected:
+                raise AssertionError(f'Parallel mode wrote other files than single decode in {parallel}')
+
+        run_parallel(input_folder, f'{folder}/some', workers=2, file_list=['red.png', 'wide.jpg'])
+        expected = {filename: data for filename, data in folder_contents(f'{folder}/single').items()
+                    if filename.startswith(('red_', 'wide_'))}
+        if folder_contents(f'{folder}/some') != expected:
+            raise AssertionError('Parallel mode wrote other files than single decode for a file list')
+    print('Parallel mode matches single decode')
+
+
+def assert_parallel_mode_raises(stage, break_run, error_type):
+    with tempfile.TemporaryDirectory() as folder:
+        input_folder = f'{folder}/input'
+        output_folder = f'{folder}/output'
+        image_multiplicator.create_folders(input_folder, output_folder)
+        for k in range(6):
+            save_image(f'{input_folder}/image_{k}.png', (40 * k, 0, 0))
+        break_run(input_folder, output_folder)
+        try:
+            run_parallel(input_folder, output_folder, workers=2, queue_size=1)
+        except error_type:
+            print(f'Parallel mode raises on a failing {stage}')
+            return
+        raise AssertionError(f'Parallel mode succeeded despite a failing {stage}')
+
+
+def unreadable_input(input_folder, output_folder):
+    os.makedirs(f'{input_folder}/folder.png')
+
+
+def unwritable_output(input_folder, output_folder):
+    os.makedirs(f'{output_folder}/image_3_flip_0_rotate_0.png')
+
+
+def undecodable_input(input_folder, output_folder):
+    with open(f'{input_folder}/image_3.png', 'wb') as f:
+        f.write(b'not an image')
+
+
+def run_tests():
+    assert_incremental_runs_rebuild_changes_only()
+    assert_incremental_runs_accept_other_spellings()
+    assert_parallel_mode_matches_single_decode()
+    assert_parallel_mode_raises('read', unreadable_input, IsADirectoryError)
+    assert_parallel_mode_raises('write', unwritable_output, IsADirectoryError)
+    assert_parallel_mode_raises('decode', undecodable_input, UnidentifiedImageError)
+
+
+def main():
+    run_tests()
+
+
+main()
@@ -1,20 +1,57 @@
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 import argparse
 import yaml
-from typing import Tuple, Dict, List
+from typing import Tuple, Dict, Iterator, List, NamedTuple, Optional
 import progressbar
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from panel_stats import Series, format_scaling_table, load_series, save_series, scaling_table, \
+    series_from_frames, summarize, write_scaling_table
+from render_cache import RenderCache
+
+# $var, ${var}, ${var:format} and [[var]] references of dashboard variables in panel queries
+VARIABLE_REFERENCE = re.compile(r"\$(\w+)|\$\{(\w+)(?::\w+)?}|\[\[(\w+)]]")
+# Value of a dashboard variable set to All
+ALL_VALUE = "$__all"
+
+
+class PanelJob(NamedTuple):
+    panel_name: str
+    save_path: str
+    timespan: Optional[Tuple[str, str]] = None
+
+
+def create_session(pool_size: int = 4, retries: int = 3, backoff_factor: float = 1.0) -> requests.Session:
+    # A single session keeps the connections to Grafana alive between renders. Renderer timeouts
+    # and errors are retried with exponential backoff: backoff_factor * 2 ** (retry - 1) seconds.
+    retry = Retry(total=retries,
+                  backoff_factor=backoff_factor,
+                  status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=None,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
 class GrafanaPanelDownloader:
     def __init__(self, grafana_url: str,
                  dashboard_uid: str,
-                 timespan: Tuple[str, str],
+                 timespan: Optional[Tuple[str, str]],
                  variables: Dict[str, Tuple[str, List[str]]],
                  image_width: int = 1000,
                  image_height: int = 500,
-                 theme: str = "light"):
+                 theme: str = "light",
+                 session: Optional[requests.Session] = None,
+                 timeout: float = 60,
+                 cache: Optional[RenderCache] = None):
         self._grafana_url = grafana_url
         self._variables = variables
         self._image_width = image_width
@@ -22,13 +59,17 @@ class GrafanaPanelDownloader:
         self._dashboard_uid = dashboard_uid
         self._theme = theme
         self._timespan = timespan
+        self._session = session or create_session()
+        self._timeout = timeout
+        self._cache = cache
         self._dashboard_json = self.__get_dashboard_json(dashboard_uid)
 
     def __get_dashboard_json(self, dashboard_uid: str):
-        dashboard_json = requests.get(f"{self._grafana_url}/api/dashboards/uid/{dashboard_uid}").json()
-        return dashboard_json
+        response = self._session.get(f"{self._grafana_url}/api/dashboards/uid/{dashboard_uid}", timeout=self._timeout)
+        response.raise_for_status()
+        return response.json()
 
-    def __get_panel_id(self, panel_name: str):
+    def __get_panel(self, panel_name: str):
         # This function will match the panel even if the name is not exactly the same
         panel_name = panel_name.replace(" ", "")
         panel_name = panel_name.replace("_", "")
@@ -36,18 +77,101 @@ class GrafanaPanelDownloader:
 
         for panel in self._dashboard_json["dashboard"]["panels"]:
             if panel_name in panel["displayTitle"].replace(" ", "").replace("_", "").lower():
-                return panel["id"]
+                return panel
         return None
 
-    def download_panel(self, panel_name: str, save_path: str):
+    def __get_panel_id(self, panel_name: str):
+        panel = self.__get_panel(panel_name)
+        return panel["id"] if panel is not None else None
+
+    def __variable_values(self) -> Dict[str, str]:
+        # Current values of the dashboard variables, overridden by the configured ones, formatted as
+        # Grafana does for Prometheus: multiple values become a regex alternation
+        values = {}
+        definitions = {}
+        for variable in self._dashboard_json["dashboard"].get("templating", {}).get("list", []):
+            definitions[variable["name"]] = variable
+            current = variable.get("current", {}).get("value")
+            if current is not None:
+                values[variable["name"]] = current
+        values.update(self._variables)
+
+        formatted = {}
+        for name, value in values.items():
+            if value == ALL_VALUE or (not isinstance(value, str) and ALL_VALUE in value):
+                # All is the custom all value of the variable if it has one, every option otherwise
+                definition = definitions.get(name, {})
+                if definition.get("allValue"):
+                    formatted[name] = definition["allValue"]
+                    continue
+                value = [option["value"] for option in definition.get("options", [])
+                         if option.get("value") != ALL_VALUE]
+                if not value:
+                    raise ValueError(f"Variable {name} is set to All but the dashboard has neither its all value "
+                                     f"nor its options, set its values in the variables of the config")
+            if isinstance(value, str):
+                formatted[name] = value
+            elif len(value) == 1:
+                formatted[name] = value[0]
+            else:
+                formatted[name] = "(" + "|".join(re.escape(single) for single in value) + ")"
+        return formatted
+
+    def __interpolate(self, value, variables: Dict[str, str]):
+        if isinstance(value, str):
+            def replace(match):
+                name = next(group for group in match.groups() if group is not None)
+                # Built-in variables such as $__interval are interpolated by Grafana itself
+                return variables.get(name, match.group(0))
+            return VARIABLE_REFERENCE.sub(replace, value)
+        if isinstance(value, dict):
+            return {key: self.__interpolate(item, variables) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.__interpolate(item, variables) for item in value]
+        return value
+
+    def query_panel(self, panel_name: str, timespan: Optional[Tuple[str, str]] = None) -> List[Series]:
+        # Results of the panel queries through the query API, the same numbers the panel would plot
+        panel = self.__get_panel(panel_name)
+        if panel is None:
+            raise ValueError(f"Panel with name {panel_name} not found")
+        timespan = timespan or self._timespan
+
+        variables = self.__variable_values()
+        queries = []
+        for target in panel.get("targets", []):
+            if target.get("hide"):
+                continue
+            query = self.__interpolate(target, variables)
+            query["datasource"] = query.get("datasource") or self.__interpolate(panel.get("datasource"), variables)
+            query["maxDataPoints"] = self._image_width
+            queries.append(query)
+
+        response = self._session.post(f"{self._grafana_url}/api/ds/query",
+                                      json={"queries": queries, "from": str(timespan[0]), "to": str(timespan[1])},
+                                      timeout=self._timeout)
+        response.raise_for_status()
+        series = []
+        for result in response.json()["results"].values():
+            if "error" in result:
+                raise ValueError(f"Query of panel {panel_name} failed: {result['error']}")
+            series.extend(series_from_frames(result.get("frames", [])))
+        return series
+
+    def download_panel_data(self, panel_name: str, save_path: str, timespan: Optional[Tuple[str, str]] = None,
+                            data_format: str = "csv") -> str:
+        return save_series(save_path, self.query_panel(panel_name, timespan), data_format)
+
+    def download_panel(self, panel_name: str, save_path: str, timespan: Optional[Tuple[str, str]] = None):
         panel_id = self.__get_panel_id(panel_name)
         if panel_id is None:
             raise ValueError(f"Panel with name {panel_name} not found")
+        timespan = timespan or self._timespan
 
         url = f"{self._grafana_url}/render/d-solo/{self._dashboard_uid}/" \
               f"{self._dashboard_json['meta']['slug']}?" \
               f"orgId=1&panelId={panel_id}&width={self._image_width}&height={self._image_height}" \
-              f"&from={self._timespan[0]}&to={self._timespan[1]}" \
+              f"&from={timespan[0]}&to={timespan[1]}" \
               f"&tz=America%2FArgentina%2FBuenos_Aires&theme={self._theme}"
 
         for variable in self._variables:
@@ -56,12 +180,51 @@ class GrafanaPanelDownloader:
             else:
                 for value in self._variables[variable]:
                     url += f"&var-{variable}={value}"
-        panel_png = requests.get(url).content
+        panel_png = self.__render(url, panel_id, timespan)
 
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
         with open(save_path, "wb") as f:
             f.write(panel_png)
 
+    def __cache_key(self, panel_id: int, timespan: Tuple[str, str]) -> Optional[str]:
+        # Ranges relative to now render something new every time, they are never cached
+        if self._cache is None or any("now" in str(time_point) for time_point in timespan):
+            return None
+        return self._cache.key(grafana_url=self._grafana_url,
+                               dashboard_uid=self._dashboard_uid,
+                               dashboard_version=self._dashboard_json["dashboard"].get("version"),
+                               panel_id=panel_id,
+                               timespan=list(timespan),
+                               variables=self._variables,
+                               size=[self._image_width, self._image_height],
+                               theme=self._theme)
+
+    def __render(self, url: str, panel_id: int, timespan: Tuple[str, str]) -> bytes:
+        cache_key = self.__cache_key(panel_id, timespan)
+        if cache_key is not None:
+            panel_png = self._cache.get(cache_key)
+            if panel_png is not None:
+                return panel_png
+
+        response = self._session.get(url, timeout=self._timeout)
+        response.raise_for_status()
+        if cache_key is not None:
+            self._cache.put(cache_key, response.content)
+        return response.content
+
+    def download_panels(self, jobs: List[PanelJob], concurrency: int = 4,
+                        data_format: Optional[str] = None) -> Iterator[PanelJob]:
+        # Renders take seconds on the Grafana side, so several are requested at the same time.
+        # Jobs are yielded as they finish. With a data format the query results are saved instead.
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            if data_format is None:
+                futures = {pool.submit(self.download_panel, *job): job for job in jobs}
+            else:
+                futures = {pool.submit(self.download_panel_data, *job, data_format): job for job in jobs}
+            for future in as_completed(futures):
+                future.result()
+                yield futures[future]
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -73,6 +236,35 @@ def main():
                         default=".",
                         help="Path that will be appended to the each folder path. Default is the current directory",
                         type=str)
+    parser.add_argument("-j", "--concurrency",
+                        default=4,
+                        help="Amount of panels rendered at the same time. Default is 4",
+                        type=int)
+    parser.add_argument("-r", "--retries",
+                        default=3,
+                        help="Retries of a render that timed out or failed. Default is 3",
+                        type=int)
+    parser.add_argument("-t", "--timeout",
+                        default=60,
+                        help="Seconds to wait for a render before retrying it. Default is 60",
+                        type=float)
+    parser.add_argument("--cache_dir",
+                        default=".render_cache",
+                        help="Folder of the cache of rendered panels. Default is .render_cache",
+                        type=str)
+    parser.add_argument("--cache_size",
+                        default=1024,
+                        help="Maximum size of the render cache in MiB, 0 disables it. Default is 1024",
+                        type=int)
+    parser.add_argument("-m", "--mode",
+                        default="render",
+                        choices=["render", "data"],
+                        help="render saves the panels as images, data saves the results of their queries and "
+                             "writes a scaling table of the throughput panel to scaling.csv. Default is render")
+    parser.add_argument("-f", "--data_format",
+                        default="csv",
+                        choices=["csv", "npz"],
+                        help="Format of the query results of the data mode. Default is csv")
 
     args = parser.parse_args()
     context = args.context
@@ -80,24 +272,46 @@ def main():
     with open(args.config_path, "r") as f:
         config = yaml.load(f, Loader=yaml.FullLoader)
 
-    total_pngs = len(config["folders"]) * len(config["panels"])
-    bar = progressbar.ProgressBar(maxval=total_pngs,
-                                  widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage()])
+    cache = RenderCache(args.cache_dir, args.cache_size * 2 ** 20) if args.cache_size > 0 else None
+    # The dashboard is fetched once, every folder only changes the timespan of its jobs
+    grafana_panel_downloader = GrafanaPanelDownloader(grafana_url=config["grafana_url"],
+                                                      dashboard_uid=config["dashboard_uid"],
+                                                      timespan=None,
+                                                      variables=config.get("variables", {}),
+                                                      image_width=config["size"]["width"],
+                                                      image_height=config["size"]["height"],
+                                                      theme=config["theme"],
+                                                      session=create_session(args.concurrency, args.retries),
+                                                      timeout=args.timeout,
+                                                      cache=cache)
+    data_format = args.data_format if args.mode == "data" else None
+    throughput_panel = config.get("throughput_panel", "Per node throughput")
+    panels = list(config["panels"])
+    if data_format is not None and throughput_panel not in panels:
+        panels.append(throughput_panel)
 
+    jobs = []
     for folder_name in config["folders"]:
         start_time = config["folders"][folder_name]["from"]
         end_time = config["folders"][folder_name]["to"]
-        grafana_panel_downloader = GrafanaPanelDownloader(grafana_url=config["grafana_url"],
-                                                          dashboard_uid=config["dashboard_uid"],
-                                                          timespan=(start_time, end_time),
-                                                          variables=config["variables"],
-                                                          image_width=config["size"]["width"],
-                                                          image_height=config["size"]["height"],
-                                                          theme=config["theme"])
-        for panel_name in config["panels"]:
-            save_path = os.path.join(context, folder_name, f"{panel_name}.png")
-            grafana_panel_downloader.download_panel(panel_name, save_path)
-            bar.update(bar.value + 1)
+        for panel_name in panels:
+            save_path = os.path.join(context, folder_name, panel_name if data_format else f"{panel_name}.png")
+            jobs.append(PanelJob(panel_name, save_path, (start_time, end_time)))
+
+    bar = progressbar.ProgressBar(maxval=len(jobs),
+                                  widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage()])
+    for _ in grafana_panel_downloader.download_panels(jobs, args.concurrency, data_format):
+        bar.update(bar.value + 1)
+    if cache is not None and data_format is None:
+        print(cache.summary())
+
+    if data_format is not None:
+        summaries = {folder_name: summarize(load_series(
+                         os.path.join(context, folder_name, f"{throughput_panel}.{data_format}")))
+                     for folder_name in config["folders"]}
+        rows = scaling_table(summaries)
+        write_scaling_table(os.path.join(context, "scaling.csv"), rows)
+        print(format_scaling_table(rows))
 
 
 if __name__ == "__main__":
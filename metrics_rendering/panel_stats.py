@@ -0,0 +1,123 @@
+import csv
+import os
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+
+class Series(NamedTuple):
+    name: str
+    times: np.ndarray
+    values: np.ndarray
+
+
+def series_from_frames(frames: List[Dict]) -> List[Series]:
+    # Grafana data frames hold a time field and one or more number fields, every number field is a series
+    series = []
+    for frame in frames:
+        fields = frame["schema"]["fields"]
+        values = frame["data"]["values"]
+        time_pos = next((pos for pos, field in enumerate(fields) if field.get("type") == "time"), None)
+        if time_pos is None:
+            continue
+        times = np.asarray(values[time_pos], dtype=np.int64)
+        for pos, field in enumerate(fields):
+            if pos == time_pos or field.get("type") != "number":
+                continue
+            labels = field.get("labels") or {}
+            name = (field.get("config") or {}).get("displayNameFromDS") or frame["schema"].get("name") \
+                or ",".join(f"{label}={value}" for label, value in sorted(labels.items())) or field["name"]
+            series.append(Series(name, times, np.array(values[pos], dtype=np.float64)))
+    return series
+
+
+def save_series(path: str, series: List[Series], data_format: str = "csv") -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if data_format == "npz":
+        path = f"{path}.npz"
+        arrays = {"names": np.array([single.name for single in series], dtype=str)}
+        for pos, single in enumerate(series):
+            arrays[f"times_{pos}"] = single.times
+            arrays[f"values_{pos}"] = single.values
+        np.savez_compressed(path, **arrays)
+        return path
+
+    path = f"{path}.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["series", "time", "value"])
+        for single in series:
+            writer.writerows(zip([single.name] * len(single.times), single.times.tolist(), single.values.tolist()))
+    return path
+
+
+def load_series(path: str) -> List[Series]:
+    if path.endswith(".npz"):
+        with np.load(path) as arrays:
+            return [Series(str(name), arrays[f"times_{pos}"], arrays[f"values_{pos}"])
+                    for pos, name in enumerate(arrays["names"])]
+
+    rows: Dict[str, List] = {}
+    with open(path, newline="") as f:
+        for name, time_point, value in list(csv.reader(f))[1:]:
+            rows.setdefault(name, []).append((int(time_point), float(value)))
+    return [Series(name, np.array([time_point for time_point, _ in points], dtype=np.int64),
+                   np.array([value for _, value in points], dtype=np.float64))
+            for name, points in rows.items()]
+
+
+def align(series: List[Series]) -> np.ndarray:
+    # Nodes x timestamps matrix on the union of the timestamps, missing samples are NaN
+    times = np.unique(np.concatenate([single.times for single in series]))
+    matrix = np.full((len(series), len(times)), np.nan)
+    for row, single in enumerate(series):
+        matrix[row, np.searchsorted(times, single.times)] = single.values
+    return matrix
+
+
+def summarize(series: List[Series]) -> Dict[str, float]:
+    # Series are the per node throughput of a run. The combined throughput is their sum at every
+    # timestamp, and the coefficient of variation compares the mean throughput of the nodes.
+    if not series:
+        return {"nodes": 0, "mean": np.nan, "p50": np.nan, "p99": np.nan, "cv": np.nan}
+    matrix = align(series)
+    sampled = ~np.isnan(matrix).all(axis=0)
+    combined = np.nansum(matrix[:, sampled], axis=0)
+    node_means = np.nanmean(matrix, axis=1)
+    mean_of_nodes = node_means.mean()
+    return {
+        "nodes": len(series),
+        "mean": float(combined.mean()) if combined.size else np.nan,
+        "p50": float(np.percentile(combined, 50)) if combined.size else np.nan,
+        "p99": float(np.percentile(combined, 99)) if combined.size else np.nan,
+        "cv": float(node_means.std() / mean_of_nodes) if mean_of_nodes else np.nan,
+    }
+
+
+def scaling_table(summaries: Dict[str, Dict[str, float]]) -> List[Dict]:
+    # Speedup and efficiency are relative to the first folder, e.g. the 4 nodes run
+    rows = []
+    base = next(iter(summaries.values()), None)
+    for folder_name, summary in summaries.items():
+        speedup = summary["mean"] / base["mean"] if base and base["mean"] else np.nan
+        node_ratio = summary["nodes"] / base["nodes"] if base and base["nodes"] else np.nan
+        # A run without any series has no nodes, its efficiency is as unknown as its throughput
+        efficiency = speedup / node_ratio if node_ratio else np.nan
+        rows.append({"folder": folder_name, **summary, "speedup": speedup, "efficiency": efficiency})
+    return rows
+
+
+def write_scaling_table(path: str, rows: List[Dict]):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["folder", "nodes", "mean", "p50", "p99", "cv", "speedup", "efficiency"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def format_scaling_table(rows: List[Dict]) -> str:
+    lines = [f"{'folder':<15} {'nodes':>6} {'mean':>12} {'p50':>12} {'p99':>12} {'cv':>8} {'speedup':>8} "
+             f"{'efficiency':>10}"]
+    for row in rows:
+        lines.append(f"{row['folder']:<15} {row['nodes']:>6} {row['mean']:>12.2f} {row['p50']:>12.2f} "
+                     f"{row['p99']:>12.2f} {row['cv']:>8.3f} {row['speedup']:>8.2f} {row['efficiency']:>10.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+
+class RenderCache:
+    # On-disk cache of rendered panels. Entries are addressed by a hash of everything that changes
+    # a render, so a changed dashboard version, range, size or theme never hits a stale image.
+    # The least recently used entries are evicted once the cache grows over max_bytes.
+    def __init__(self, path: str, max_bytes: int = 1024 * 2 ** 20):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(path, exist_ok=True)
+        # Sizes and access times of the entries, loaded once and kept up to date afterwards
+        self._entries: Dict[str, os.stat_result] = {}
+        for filename in os.listdir(path):
+            if filename.endswith(".png"):
+                self._entries[filename[:-len(".png")]] = os.stat(os.path.join(path, filename))
+        self._size = sum(entry.st_size for entry in self._entries.values())
+
+    @staticmethod
+    def key(**parts) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def __entry_path(self, key: str) -> str:
+        return os.path.join(self._path, f"{key}.png")
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # The modification time orders entries for eviction, a hit makes the entry recent again
+            os.utime(self.__entry_path(key))
+            self._entries[key] = os.stat(self.__entry_path(key))
+        with open(self.__entry_path(key), "rb") as f:
+            return f.read()
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self._max_bytes:
+            return
+        temporary_path = f"{self.__entry_path(key)}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            os.replace(temporary_path, self.__entry_path(key))
+            previous = self._entries.get(key)
+            self._size += len(data) - (previous.st_size if previous is not None else 0)
+            self._entries[key] = os.stat(self.__entry_path(key))
+            self.__evict()
+
+    def __evict(self):
+        if self._size <= self._max_bytes:
+            return
+        for key in sorted(self._entries, key=lambda entry_key: self._entries[entry_key].st_mtime_ns):
+            if self._size <= self._max_bytes:
+                break
+            self._size -= self._entries.pop(key).st_size
+            os.remove(self.__entry_path(key))
+            self.evictions += 1
+
+    def summary(self) -> str:
+        requests = self.hits + self.misses
+        hit_rate = self.hits / requests if requests else 0.0
+        return f"Render cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate), " \
+               f"{self.evictions} evictions, {self._size / 2 ** 20:.1f} MiB in {len(self._entries)} entries"
@@ -0,0 +1,285 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import yaml
+
+from download_metrics import GrafanaPanelDownloader, PanelJob, create_session
+from panel_stats import Series, format_scaling_table, load_series, scaling_table, summarize
+from render_cache import RenderCache
+
+PANELS = ["CPU Usage (Workers)", "Per node throughput", "Coefficient of variation"]
+
+
+class StubGrafana:
+    # Grafana stand-in: serves a dashboard and renders every panel as a few bytes. The first
+    # render of every url fails and renders are slow, so retries and concurrency are exercised.
+    def __init__(self, render_delay: float = 0.05):
+        stub = self
+        self.requests = {}
+        self.queries = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                with stub._lock:
+                    attempts = stub.requests[self.path] = stub.requests.get(self.path, 0) + 1
+
+                if url.path.startswith("/api/dashboards/uid/"):
+                    self.__send(json.dumps(stub.dashboard()).encode(), "application/json")
+                elif url.path.startswith("/render/d-solo/"):
+                    if attempts == 1:
+                        self.send_error(503)
+                        return
+                    with stub._lock:
+                        stub.in_flight += 1
+                        stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    time.sleep(render_delay)
+                    with stub._lock:
+                        stub.in_flight -= 1
+                    self.__send(stub.render(parse_qs(url.query)), "image/png")
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if self.path != "/api/ds/query":
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.queries.append(body)
+                self.__send(json.dumps(stub.query(body)).encode(), "application/json")
+
+            def __send(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @staticmethod
+    def dashboard():
+        panels = [{"id": panel_id, "displayTitle": title, "datasource": {"uid": "prometheus"},
+                   "targets": [{"refId": "A", "expr": f'rate(metric_{panel_id}{{node=~"$node"}}[$__rate_interval])'}]}
+                  for panel_id, title in enumerate(PANELS)]
+        return {
+            "dashboard": {"panels": panels, "version": 3,
+                          "templating": {"list": [{"name": "node", "current": {"value": ["node_1", "node_2"]}}]}},
+            "meta": {"slug": "grid-search"},
+        }
+
+    @staticmethod
+    def node_throughput(start: int, node: int) -> List[float]:
+        return [start + node * 10 + sample for sample in range(4)]
+
+    @classmethod
+    def query(cls, body):
+        # Every node of the run is a frame, the values depend on the start of the range
+        start = int(body["from"])
+        frames = [{"schema": {"fields": [{"name": "Time", "type": "time"},
+                                         {"name": "Value", "type": "number", "labels": {"node": f"node_{node}"}}]},
+                   "data": {"values": [[start * 1000 + sample * 15000 for sample in range(4)],
+                                       cls.node_throughput(start, node)]}}
+                  for node in range(start // 10)]
+        return {"results": {query["refId"]: {"frames": frames} for query in body["queries"]}}
+
+    @staticmethod
+    def render(query) -> bytes:
+        return f"{query['panelId'][0]}:{query['from'][0]}:{query['to'][0]}".encode()
+
+    def __enter__(self) -> "StubGrafana":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def assert_panels_are_downloaded_concurrently(concurrency: int):
+    with StubGrafana() as grafana, tempfile.TemporaryDirectory() as folder:
+        downloader = GrafanaPanelDownloader(grafana.url, "grid_search_dashboard", ("0", "1"), {},
+                                            session=create_session(concurrency, retries=2, backoff_factor=0.01))
+        jobs = [PanelJob(panel_name, os.path.join(folder, f"{run}", f"{panel_name}.png"), (str(run), str(run + 1)))
+                for run in range(4) for panel_name in PANELS]
+        finished = list(downloader.download_panels(jobs, concurrency))
+
+        if sorted(finished) != sorted(jobs):
+            raise AssertionError(f"Downloaded {len(finished)} panels, expected {len(jobs)}")
+        for panel_name, save_path, timespan in jobs:
+            with open(save_path, "rb") as f:
+                expected = f"{PANELS.index(panel_name)}:{timespan[0]}:{timespan[1]}".encode()
+                if f.read() != expected:
+                    raise AssertionError(f"{save_path} does not hold the render of {panel_name}")
+        if grafana.requests["/api/dashboards/uid/grid_search_dashboard"] != 1:
+            raise AssertionError("Dashboard was fetched more than once")
+        if not 1 < grafana.max_in_flight <= concurrency:
+            raise AssertionError(f"{grafana.max_in_flight} renders in flight, limit is {concurrency}")
+    print("Panels are downloaded concurrently")
+
+
+def assert_script_runs_against_stub():
+    with StubGrafana(render_delay=0) as grafana, tempfile.TemporaryDirectory() as folder:
+        config = {
+            "grafana_url": grafana.url,
+            "dashboard_uid": "grid_search_dashboard",
+            "folders": {"4-Nodes": {"from": 10, "to": 20}, "8-Nodes": {"from": 30, "to": 40}},
+            "panels": PANELS,
+            "size": {"width": 100, "height": 50},
+            "theme": "light",
+        }
+        config_path = os.path.join(folder, "config.yaml")
+        with open(config_path, "w") as f:
+            yaml.dump(config, f)
+
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "download_metrics.py")
+        subprocess.run([sys.executable, script, "-p", config_path, "-c", folder, "-j", "3",
+                        "--cache_dir", os.path.join(folder, "cache")],
+                       check=True, stdout=subprocess.DEVNULL)
+        for folder_name, timespan in config["folders"].items():
+            for panel_name in PANELS:
+                with open(os.path.join(folder, folder_name, f"{panel_name}.png"), "rb") as f:
+                    if f.read() != f"{PANELS.index(panel_name)}:{timespan['from']}:{timespan['to']}".encode():
+                        raise AssertionError(f"{folder_name}/{panel_name}.png does not hold its render")
+    print("Script runs against stub")
+
+
+def assert_renders_are_cached():
+    with StubGrafana(render_delay=0) as grafana, tempfile.TemporaryDirectory() as folder:
+        cache = RenderCache(os.path.join(folder, "cache"))
+        jobs = [PanelJob(panel_name, os.path.join(folder, "renders", f"{panel_name}.png"), ("10", "20"))
+                for panel_name in PANELS]
+        for _ in range(2):
+            downloader = GrafanaPanelDownloader(grafana.url, "grid_search_dashboard", None, {},
+                                                session=create_session(retries=2, backoff_factor=0.01), cache=cache)
+            list(downloader.download_panels(jobs))
+
+        renders = sum(attempts for path, attempts in grafana.requests.items() if path.startswith("/render/"))
+        if cache.hits != len(PANELS) or cache.misses != len(PANELS) or renders != 2 * len(PANELS):
+            raise AssertionError(f"Cache had {cache.hits} hits and {cache.misses} misses for {renders} renders")
+
+        # Another size is another render, and the cache only has room for one entry
+        small_cache = RenderCache(os.path.join(folder, "small_cache"), max_bytes=len(StubGrafana.render(
+            {"panelId": ["0"], "from": ["10"], "to": ["20"]})))
+        downloader = GrafanaPanelDownloader(grafana.url, "grid_search_dashboard", None, {}, image_width=10,
+                                            session=create_session(retries=2, backoff_factor=0.01), cache=small_cache)
+        list(downloader.download_panels(jobs))
+        if small_cache.misses != len(PANELS) or small_cache.evictions != len(PANELS) - 1:
+            raise AssertionError(f"Small cache had {small_cache.misses} misses and {small_cache.evictions} evictions")
+        if RenderCache(os.path.join(folder, "small_cache")).size > small_cache.size:
+            raise AssertionError("Evicted entries were left on disk")
+    print("Renders are cached")
+
+
+def assert_panel_data_is_summarized(data_format: str):
+    with StubGrafana(render_delay=0) as grafana, tempfile.TemporaryDirectory() as folder:
+        config = {
+            "grafana_url": grafana.url,
+            "dashboard_uid": "grid_search_dashboard",
+            "folders": {"2-Nodes": {"from": 20, "to": 30}, "4-Nodes": {"from": 40, "to": 50}},
+            "panels": PANELS[:1],
+            "throughput_panel": "Per node throughput",
+            "variables": {"node": ["node_0", "node_1", "node_2", "node_3"]},
+            "size": {"width": 100, "height": 50},
+            "theme": "light",
+        }
+        config_path = os.path.join(folder, "config.yaml")
+        with open(config_path, "w") as f:
+            yaml.dump(config, f)
+
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "download_metrics.py")
+        subprocess.run([sys.executable, script, "-p", config_path, "-c", folder, "-m", "data", "-f", data_format],
+                       check=True, stdout=subprocess.DEVNULL)
+
+        # Panels are queried concurrently, the query of panel 0 is not necessarily the first one
+        query = next(body["queries"][0] for body in grafana.queries if "metric_0" in body["queries"][0]["expr"])
+        if query["expr"] != 'rate(metric_0{node=~"(node_0|node_1|node_2|node_3)"}[$__rate_interval])' \
+                or query["datasource"] != {"uid": "prometheus"}:
+            raise AssertionError(f"Query was not interpolated: {query}")
+
+        with open(os.path.join(folder, "scaling.csv")) as f:
+            rows = {row.split(",")[0]: row.strip().split(",") for row in f.readlines()[1:]}
+        for folder_name, timespan in config["folders"].items():
+            nodes = timespan["from"] // 10
+            series = load_series(os.path.join(folder, folder_name, f"Per node throughput.{data_format}"))
+            combined = np.sum([StubGrafana.node_throughput(timespan["from"], node) for node in range(nodes)], axis=0)
+            node_means = np.mean([StubGrafana.node_throughput(timespan["from"], node) for node in range(nodes)], axis=1)
+            summary = summarize(series)
+            if summary["nodes"] != nodes or not np.isclose(summary["mean"], combined.mean()) \
+                    or not np.isclose(summary["p99"], np.percentile(combined, 99)) \
+                    or not np.isclose(summary["cv"], node_means.std() / node_means.mean()):
+                raise AssertionError(f"{folder_name} was summarized as {summary}")
+            if int(rows[folder_name][1]) != nodes or not np.isclose(float(rows[folder_name][2]), combined.mean()):
+                raise AssertionError(f"Scaling table row of {folder_name} is {rows[folder_name]}")
+    print("Panel data is summarized")
+
+
+def assert_all_value_is_expanded(current, all_value, options, expected_selector):
+    with StubGrafana(render_delay=0) as grafana:
+        dashboard = StubGrafana.dashboard()
+        dashboard["dashboard"]["templating"]["list"][0].update({
+            "current": {"text": "All", "value": current}, "allValue": all_value,
+            "options": [{"text": option, "value": option} for option in ["$__all"] + options]})
+        grafana.dashboard = lambda: dashboard
+        downloader = GrafanaPanelDownloader(grafana.url, "grid_search_dashboard", ("20", "30"), {},
+                                            session=create_session(retries=2, backoff_factor=0.01))
+        try:
+            downloader.query_panel(PANELS[0])
+        except ValueError:
+            if expected_selector is not None:
+                raise
+        else:
+            expr = grafana.queries[-1]["queries"][0]["expr"]
+            if expected_selector is None or expr != f'rate(metric_0{{node=~"{expected_selector}"}}[$__rate_interval])':
+                raise AssertionError(f"All of {current} with {all_value} and {options} was interpolated in {expr}")
+    print("All value is expanded")
+
+
+def assert_scaling_table_allows_empty_runs():
+    series = [Series("node=node_0", np.arange(4), np.full(4, 2.0))]
+    rows = scaling_table({"4-Nodes": summarize(series), "8-Nodes": summarize([]), "16-Nodes": summarize(series)})
+    if not np.isnan(rows[1]["efficiency"]) or not np.isclose(rows[2]["efficiency"], 1.0):
+        raise AssertionError(f"Scaling table with an empty run is {rows}")
+    format_scaling_table(rows)
+    print("Scaling table allows empty runs")
+
+
+def run_tests():
+    assert_panels_are_downloaded_concurrently(3)
+    assert_script_runs_against_stub()
+    assert_renders_are_cached()
+    assert_panel_data_is_summarized("csv")
+    assert_panel_data_is_summarized("npz")
+    assert_all_value_is_expanded("$__all", ".*", ["node_0", "node_1"], ".*")
+    assert_all_value_is_expanded(["$__all"], None, ["node_0", "node_1", "node_2"], "(node_0|node_1|node_2)")
+    assert_all_value_is_expanded("$__all", "", ["node.0"], "node.0")
+    assert_all_value_is_expanded(["$__all"], None, [], None)
+    assert_scaling_table_allows_empty_runs()
+
+
+def main():
+    run_tests()
+
+
+main()
@@ -34,40 +34,278 @@ adverbs = ["quickly", "lazily", "sleepily", "noisily", "hungrily",
 ]
 
 
+import argparse
+import hashlib
+import os
 import random
+from multiprocessing import Pool
 
-random.seed(42)
+from text_index import index_path, new_offsets, write_index
 
-def sentence():
-  is_plural = random.choice([True, False])
+def sentence(rng = random):
+  is_plural = rng.choice([True, False])
   
   if is_plural:
-    determiner = random.choice(determiners_plural)
-    animal = random.choice(animals_plural)
-    verb = random.choice(verbs_plural)
+    determiner = rng.choice(determiners_plural)
+    animal = rng.choice(animals_plural)
+    verb = rng.choice(verbs_plural)
   else:
-    determiner = random.choice(determiners)
-    animal = random.choice(animals)
-    verb = random.choice(verbs)
+    determiner = rng.choice(determiners)
+    animal = rng.choice(animals)
+    verb = rng.choice(verbs)
     
-  adjective = random.choice(adjectives)
-  adverb = random.choice(adverbs)
+  adjective = rng.choice(adjectives)
+  adverb = rng.choice(adverbs)
   
   return f"{determiner} {adjective} {animal} {verb} {adverb}."
 
-def paragraph():
-  num_sentences = random.randint(3, 7)
-  return " ".join([sentence() for _ in range(num_sentences)])
+def paragraph(rng = random):
+  num_sentences = rng.randint(3, 7)
+  return " ".join([sentence(rng) for _ in range(num_sentences)])
 
-def text(paragraphs = 50*10**6, max_size = 4.3*10**9, fileName = "input.txt"):
+def text(paragraphs = 50*10**6, max_size = 4.3*10**9, fileName = "input.txt", index = False):
   bytes_written = 0
+  offsets = new_offsets() if index else None
   with open(fileName, "w") as file:
     for _ in range(paragraphs):
       par = paragraph() + "\n\n"
+      if offsets is not None:
+        offsets.append(bytes_written)
       file.write(par)
       bytes_written += len(par)
       if (bytes_written > max_size):
         break
+  if offsets is not None:
+    write_index(index_path(fileName), bytes_written, offsets)
 
-      
-text()
\ No newline at end of file
+# Batched mode: the vocabulary is encoded once and word indices for thousands of sentences
+# are drawn at a time with NumPy. Every sentence is 5 tokens (word plus separator), and the
+# bytes of all the tokens of a batch are gathered from the vocabulary in a single operation.
+# numpy is only imported by this mode, so the default mode keeps working without it.
+
+def _vocabulary():
+  import numpy as np
+
+  tokens = []
+  # Position of the first token of each word list in the vocabulary and amount of words
+  bases = {}
+  def add(name, words, suffix):
+    bases[name] = (len(tokens), len(words))
+    tokens.extend((word + suffix).encode() for word in words)
+
+  add("determiners", determiners, " ")
+  add("determiners_plural", determiners_plural, " ")
+  add("adjectives", adjectives, " ")
+  add("animals", animals, " ")
+  add("animals_plural", animals_plural, " ")
+  add("verbs", verbs, " ")
+  add("verbs_plural", verbs_plural, " ")
+  add("adverbs", adverbs, ". ")
+  add("adverbs_last", adverbs, ".\n\n")
+
+  lengths = np.array([len(token) for token in tokens], dtype=np.int64)
+  offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+  data = np.frombuffer(b"".join(tokens), dtype=np.uint8)
+  return data, offsets, lengths, bases
+
+def batched_paragraphs(rng, paragraphs_per_batch = 4096):
+  import numpy as np
+
+  data, offsets, lengths, bases = _vocabulary()
+  max_sentence_size = int(lengths.max()) * 5
+  # Reused between batches, it always fits the largest possible batch
+  buffer = bytearray(paragraphs_per_batch * 7 * max_sentence_size)
+  view = np.frombuffer(buffer, dtype=np.uint8)
+
+  def choose(name, amount):
+    base, words = bases[name]
+    return base + rng.integers(0, words, amount)
+
+  while True:
+    sentences_per_paragraph = rng.integers(3, 8, paragraphs_per_batch)
+    amount = int(sentences_per_paragraph.sum())
+    is_last = np.zeros(amount, dtype=bool)
+    is_last[np.cumsum(sentences_per_paragraph) - 1] = True
+    is_plural = rng.integers(0, 2, amount).astype(bool)
+
+    sentence_tokens = np.empty((amount, 5), dtype=np.int64)
+    sentence_tokens[:, 0] = np.where(is_plural, choose("determiners_plural", amount), choose("determiners", amount))
+    sentence_tokens[:, 1] = choose("adjectives", amount)
+    sentence_tokens[:, 2] = np.where(is_plural, choose("animals_plural", amount), choose("animals", amount))
+    sentence_tokens[:, 3] = np.where(is_plural, choose("verbs_plural", amount), choose("verbs", amount))
+    sentence_tokens[:, 4] = np.where(is_last, choose("adverbs_last", amount), choose("adverbs", amount))
+
+    token_ids = sentence_tokens.ravel()
+    token_lengths = lengths[token_ids]
+    size = int(token_lengths.sum())
+    token_starts = np.cumsum(token_lengths) - token_lengths
+    source = np.repeat(offsets[token_ids] - token_starts, token_lengths) + np.arange(size)
+    np.take(data, source, out=view[:size])
+    # Paragraphs start at the first token of their first sentence
+    paragraph_starts = token_starts[(np.cumsum(sentences_per_paragraph) - sentences_per_paragraph) * 5]
+    yield memoryview(buffer)[:size], paragraph_starts
+
+def batched_bytes(rng, size, offsets = None, base = 0):
+  # Exactly size bytes, the last paragraph is cut where the size is reached. Paragraph starts
+  # are appended to offsets, shifted by base, when it is given.
+  parts = []
+  written = 0
+  batches = batched_paragraphs(rng)
+  while written < size:
+    batch, paragraph_starts = next(batches)
+    if offsets is not None:
+      _extend_offsets(offsets, paragraph_starts, base + written, size - written)
+    parts.append(bytes(batch[:size - written]))
+    written += len(parts[-1])
+  return b"".join(parts)
+
+def _extend_offsets(offsets, paragraph_starts, base, limit):
+  offsets.frombytes((paragraph_starts[paragraph_starts < limit] + base).astype("<u8").tobytes())
+
+def batched_text(max_size = 4.3*10**9, fileName = "input.txt", seed = 42, align = 1, index = False):
+  import numpy as np
+
+  total_size = int(max_size) // align * align
+  written = 0
+  offsets = new_offsets() if index else None
+  rng = np.random.default_rng(seed)
+  batches = batched_paragraphs(rng)
+  with open(fileName, "wb") as file:
+    while written < total_size:
+      batch, paragraph_starts = next(batches)
+      if offsets is not None:
+        _extend_offsets(offsets, paragraph_starts, written, total_size - written)
+      batch = batch[:total_size - written]
+      file.write(batch)
+      written += len(batch)
+  if offsets is not None:
+    write_index(index_path(fileName), total_size, offsets)
+
+# Parallel mode: the output is split in fixed-size blocks and every block is generated by its
+# own generator, seeded from the global seed and the block index. The content of a block does
+# not depend on which worker writes it, so the file is the same for any amount of workers.
+# Blocks hold whole paragraphs, the room left by the last one is padded with spaces.
+
+def block_seed(seed, block_index):
+  digest = hashlib.sha256(f"{seed}:{block_index}".encode()).digest()
+  return int.from_bytes(digest[:8], "little")
+
+def _whole_paragraphs(data, paragraph_starts, block_size):
+  # A paragraph cut by the end of the block is dropped and its bytes become spaces at the end
+  # of the paragraph before it, so the block only holds whole paragraphs and the next block
+  # starts on one. Returns the block and the amount of paragraphs it holds.
+  if data.endswith(b"\n\n") or len(paragraph_starts) < 2:
+    return data, len(paragraph_starts)
+  cut = paragraph_starts[-1]
+  return data[:cut - 2] + b" " * (block_size - cut) + b"\n\n", len(paragraph_starts) - 1
+
+def block(seed, block_index, block_size, engine = "python", offsets = None, base = 0):
+  paragraph_starts = new_offsets()
+  if engine == "numpy":
+    import numpy as np
+    data = batched_bytes(np.random.default_rng([seed, block_index]), block_size, paragraph_starts)
+  else:
+    rng = random.Random(block_seed(seed, block_index))
+    pars = []
+    size = 0
+    while size < block_size:
+      paragraph_starts.append(size)
+      par = (paragraph(rng) + "\n\n").encode()
+      pars.append(par)
+      size += len(par)
+    data = b"".join(pars)[:block_size]
+
+  data, amount = _whole_paragraphs(data, paragraph_starts, block_size)
+  if offsets is not None:
+    offsets.extend(base + start for start in paragraph_starts[:amount])
+  return data
+
+_output_fd = None
+
+def _open_output(fileName):
+  global _output_fd
+  _output_fd = os.open(fileName, os.O_WRONLY)
+
+def _write_block(job):
+  seed, block_index, block_size, total_size, engine, index = job
+  offset = block_index * block_size
+  offsets = new_offsets() if index else None
+  data = memoryview(block(seed, block_index, min(block_size, total_size - offset), engine, offsets, offset))
+  # A single pwrite may write less than asked, e.g. at most about 2 GiB on Linux
+  written = 0
+  while written < len(data):
+    written += os.pwrite(_output_fd, data[written:], offset + written)
+  return block_index, offsets
+
+def parallel_text(max_size = 4.3*10**9, fileName = "input.txt", seed = 42, block_size = 16*2**20, workers = None,
+                  engine = "python", align = 1, index = False):
+  total_size = int(max_size) // align * align
+  # Every worker writes its blocks in place on a preallocated file
+  with open(fileName, "wb") as file:
+    file.truncate(total_size)
+
+  blocks = (total_size + block_size - 1) // block_size
+  jobs = ((seed, block_index, block_size, total_size, engine, index) for block_index in range(blocks))
+  # Offsets of each block arrive in completion order, they are joined in block order at the end
+  block_offsets = {}
+  with Pool(workers, initializer=_open_output, initargs=(fileName,)) as pool:
+    for block_index, offsets in pool.imap_unordered(_write_block, jobs):
+      if offsets is not None:
+        block_offsets[block_index] = offsets
+  if index:
+    offsets = new_offsets()
+    for block_index in range(blocks):
+      offsets.extend(block_offsets.pop(block_index))
+    write_index(index_path(fileName), total_size, offsets, block_size)
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("-o", "--output",
+                      default="input.txt",
+                      help="Path of the generated file. Default is input.txt",
+                      type=str)
+  parser.add_argument("-s", "--max_size",
+                      default=4.3*10**9,
+                      help="Size of the generated text in bytes. Default is 4.3e9",
+                      type=float)
+  parser.add_argument("--seed",
+                      default=42,
+                      help="Random seed. Default is 42",
+                      type=int)
+  parser.add_argument("-p", "--parallel",
+                      action="store_true",
+                      help="Generate fixed-size blocks in parallel, the output is exactly max_size bytes")
+  parser.add_argument("-w", "--workers",
+                      default=None,
+                      help="Amount of worker processes of the parallel mode. Default is the amount of CPUs",
+                      type=int)
+  parser.add_argument("-b", "--block_size",
+                      default=16*2**20,
+                      help="Size in bytes of the blocks of the parallel mode. Default is 16 MiB",
+                      type=int)
+  parser.add_argument("-e", "--engine",
+                      default="python",
+                      choices=["python", "numpy"],
+                      help="python draws one word at a time, numpy draws and assembles thousands of sentences "
+                           "at once and writes exactly max_size bytes. Default is python")
+  parser.add_argument("-a", "--align",
+                      default=1,
+                      help="With the numpy engine or the parallel mode, the size is rounded down to a multiple "
+                           "of align bytes, e.g. 16 for AES blocks. Default is 1",
+                      type=int)
+  parser.add_argument("-i", "--index",
+                      action="store_true",
+                      help="Also write the paragraph offsets to <output>.idx, read them with text_index.TextIndex")
+
+  args = parser.parse_args()
+  if args.parallel:
+    parallel_text(args.max_size, args.output, args.seed, args.block_size, args.workers, args.engine, args.align,
+                  args.index)
+  elif args.engine == "numpy":
+    batched_text(args.max_size, args.output, args.seed, args.align, args.index)
+  else:
+    random.seed(args.seed)
+    text(max_size = args.max_size, fileName = args.output, index = args.index)
+
+if __name__ == "__main__":
+  main()
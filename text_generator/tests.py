@@ -0,0 +1,95 @@
+import random
+import re
+import tempfile
+
+import generate
+from text_index import TextIndex, index_path
+
+MODES = {
+  "text": lambda path: generate.text(max_size = 20000, fileName = path, index = True),
+  "batched_text": lambda path: generate.batched_text(20000, path, index = True),
+  "parallel_text": lambda path: generate.parallel_text(20000, path, block_size = 3000, workers = 2, index = True),
+  "parallel_text numpy": lambda path: generate.parallel_text(20000, path, block_size = 3000, workers = 2,
+                                                             engine = "numpy", index = True),
+}
+
+def paragraph_starts(data):
+  # Paragraphs are separated by a blank line, a separator at the very end starts nothing
+  return [0] + [match.end() for match in re.finditer(rb"\n\n", data) if match.end() < len(data)]
+
+def assert_index_holds_every_paragraph(mode):
+  random.seed(42)
+  with tempfile.TemporaryDirectory() as folder:
+    path = f"{folder}/input.txt"
+    MODES[mode](path)
+    with open(path, "rb") as file:
+      data = file.read()
+
+    with TextIndex(path) as index:
+      if list(index.paragraph_offsets) != paragraph_starts(data):
+        raise AssertionError(f"Index of the {mode} mode does not hold exactly the paragraph starts")
+      for k in range(index.amount_of_blocks):
+        if k * index.block_size not in index.paragraph_offsets:
+          raise AssertionError(f"Block {k} of the {mode} mode does not start on a paragraph")
+      shards = list(index.shards(5))
+      if b"".join(shards) != data:
+        raise AssertionError(f"Shards of the {mode} mode do not cover the text")
+      for shard in shards:
+        if shard and not shard[:1].tobytes().isupper():
+          raise AssertionError(f"Shard of the {mode} mode starts with {shard[:20].tobytes()}")
+    # Shards taken inside the with block stay valid after it
+    if b"".join(shards) != data:
+      raise AssertionError(f"Shards of the {mode} mode changed once the index was closed")
+  print(f"Index holds every paragraph ({mode})")
+
+def read_bytes(path):
+  with open(path, "rb") as file:
+    return file.read()
+
+def assert_parallel_text_is_independent_of_workers(engine):
+  with tempfile.TemporaryDirectory() as folder:
+    outputs = set()
+    for workers in [1, 2, 3]:
+      path = f"{folder}/input_{workers}.txt"
+      # A last block shorter than the others, and more blocks than workers
+      generate.parallel_text(23456, path, seed = 7, block_size = 2000, workers = workers, engine = engine,
+                             index = True)
+      outputs.add((read_bytes(path), read_bytes(index_path(path))))
+    if len(outputs) != 1:
+      raise AssertionError(f"Parallel text of the {engine} engine depends on the amount of workers")
+  print(f"Parallel text is independent of workers ({engine})")
+
+def assert_size_is_aligned(mode, generate_text, max_size, align):
+  with tempfile.TemporaryDirectory() as folder:
+    path = f"{folder}/input.txt"
+    generate_text(max_size, path, align)
+    size = len(read_bytes(path))
+    with TextIndex(path) as index:
+      index_size = index.size
+    if size != max_size // align * align or index_size != size:
+      raise AssertionError(f"The {mode} mode wrote {size} bytes, indexed {index_size}, "
+                           f"expected {max_size // align * align}")
+  print(f"Size is aligned ({mode}, {max_size}, {align})")
+
+ALIGNED_MODES = {
+  "batched_text": lambda max_size, path, align: generate.batched_text(max_size, path, align = align, index = True),
+  "parallel_text": lambda max_size, path, align: generate.parallel_text(max_size, path, block_size = 3000,
+                                                                        workers = 2, align = align, index = True),
+  "parallel_text numpy": lambda max_size, path, align: generate.parallel_text(max_size, path, block_size = 3000,
+                                                                              workers = 2, engine = "numpy",
+                                                                              align = align, index = True),
+}
+
+def run_tests():
+  for mode in MODES:
+    assert_index_holds_every_paragraph(mode)
+  for engine in ["python", "numpy"]:
+    assert_parallel_text_is_independent_of_workers(engine)
+  for mode, generate_text in ALIGNED_MODES.items():
+    for max_size, align in [(20000, 1), (20007, 16), (12345, 4096), (9000, 3000)]:
+      assert_size_is_aligned(mode, generate_text, max_size, align)
+
+def main():
+  run_tests()
+
+main()
@@ -0,0 +1,123 @@
+# Binary index of the paragraph offsets of a generated text, written next to it as <text>.idx
+#
+# Layout: a little-endian header (magic, version, text size, block size, amount of paragraphs)
+# followed by the byte offset of every paragraph start as unsigned 64 bit integers, sorted.
+# Blocks of the parallel mode start at multiples of the block size (0 when the text was not
+# written in blocks), every block starts with a fresh paragraph so its offset is in the index too.
+
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+INDEX_HEADER = struct.Struct("<4sHxxQQQ")
+INDEX_MAGIC = b"TXIX"
+VERSION = 1
+
+def index_path(text_path):
+  return f"{text_path}.idx"
+
+def new_offsets():
+  return array("Q")
+
+def write_index(path, text_size, paragraph_offsets, block_size = 0):
+  offsets = paragraph_offsets if isinstance(paragraph_offsets, array) else array("Q", paragraph_offsets)
+  if sys.byteorder != "little":
+    offsets = array("Q", offsets)
+    offsets.byteswap()
+  with open(path, "wb") as file:
+    file.write(INDEX_HEADER.pack(INDEX_MAGIC, VERSION, text_size, block_size, len(offsets)))
+    offsets.tofile(file)
+
+def _map(path):
+  with open(path, "rb") as file:
+    # Empty files can not be memory-mapped
+    if file.seek(0, 2) == 0:
+      return None
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+class TextIndex:
+  # Memory-maps a text and its index. Shards are memoryviews over the mapped text, so N
+  # consumers can each take the k-th shard without copying or scanning the text first.
+  def __init__(self, text_path, path = None):
+    self._index_map = _map(path or index_path(text_path))
+    if self._index_map is None:
+      raise ValueError(f"Index {path or index_path(text_path)} is empty")
+    magic, version, self.size, self.block_size, amount = INDEX_HEADER.unpack_from(self._index_map)
+    if magic != INDEX_MAGIC:
+      raise ValueError(f"{path or index_path(text_path)} is not a text index, magic is {magic!r}")
+    if version != VERSION:
+      raise ValueError(f"Unsupported text index version {version}, expected {VERSION}")
+
+    self._text_map = _map(text_path)
+    text_size = len(self._text_map) if self._text_map is not None else 0
+    if text_size != self.size:
+      raise ValueError(f"{text_path} has {text_size} bytes but its index was written for {self.size}")
+
+    self._offsets = memoryview(self._index_map)[INDEX_HEADER.size:INDEX_HEADER.size + 8 * amount]
+    if sys.byteorder == "little":
+      self.paragraph_offsets = self._offsets.cast("Q")
+    else:
+      self.paragraph_offsets = array("Q", self._offsets)
+      self.paragraph_offsets.byteswap()
+    self._text = memoryview(self._text_map) if self._text_map is not None else memoryview(b"")
+
+  @property
+  def amount_of_paragraphs(self):
+    return len(self.paragraph_offsets)
+
+  @property
+  def amount_of_blocks(self):
+    if not self.block_size:
+      return 1
+    return (self.size + self.block_size - 1) // self.block_size
+
+  def _boundary(self, position):
+    # First paragraph start at or after position, the end of the text if there is none
+    if position <= 0:
+      return 0
+    pos = bisect_left(self.paragraph_offsets, position)
+    return self.paragraph_offsets[pos] if pos < len(self.paragraph_offsets) else self.size
+
+  def shard_range(self, k, n):
+    if not 0 <= k < n:
+      raise IndexError(f"Shard {k} out of range for {n} shards")
+    # Boundaries are moved forward to the next paragraph start, shards differ at most by a paragraph
+    return self._boundary(k * self.size // n), self._boundary((k + 1) * self.size // n)
+
+  def shard(self, k, n):
+    start, end = self.shard_range(k, n)
+    return self._text[start:end]
+
+  def shards(self, n):
+    for k in range(n):
+      yield self.shard(k, n)
+
+  def block(self, k):
+    if not 0 <= k < self.amount_of_blocks:
+      raise IndexError(f"Block {k} out of range for {self.amount_of_blocks} blocks")
+    if not self.block_size:
+      return self._text[:]
+    return self._text[k * self.block_size:min((k + 1) * self.block_size, self.size)]
+
+  def close(self):
+    # Views must be released before the maps can be closed. Shards and blocks handed out may
+    # still be alive, they stay valid and the map is unmapped once the last one is released.
+    self._text.release()
+    if isinstance(self.paragraph_offsets, memoryview):
+      self.paragraph_offsets.release()
+    self._offsets.release()
+    for mapped in (self._text_map, self._index_map):
+      if mapped is not None:
+        try:
+          mapped.close()
+        except BufferError:
+          pass
+    self._text_map = self._index_map = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.close()